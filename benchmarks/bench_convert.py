@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Regression benchmark for the SRM XML converters.
+# Generates synthetic DAST and MAST exports of increasing size, times the conversion and checks that the
+# time spent per finding stays flat, i.e. conversion time grows linearly with the number of findings.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# setting path so we can include the converters from the parent and mast directories.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mast'))
+import convert_dast_results
+import convert_mast_results
+from fixtures import generateDastExport, generateMastExport
+
+def timeConversion(name, export, convert, workDir, repeat):
+  inputFile = os.path.join(workDir, f"{name}-{len(export.get('_items', export.get('findings')))}.json")
+  outputFile = inputFile + ".xml"
+  with open(inputFile, 'w', encoding='utf-8') as f:
+    json.dump(export, f)
+  # keep the best of several runs to filter out noise from other processes on the node
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    convert(inputFile, outputFile)
+    timings.append(time.perf_counter() - start)
+  return min(timings), peakMemory(convert, inputFile, outputFile)
+
+def peakMemory(convert, inputFile, outputFile):
+  # the XML report is streamed to disk, what is left of the peak is mostly the loaded json export
+  tracemalloc.start()
+  convert(inputFile, outputFile)
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return peak
+
+def main(sizes, maxRatio, repeat, processes=1):
+  converters = {
+    "dast": (generateDastExport, lambda inputFile, outputFile: convert_dast_results.createSRMXML(inputFile, outputFile, "", processes=processes)),
+    "mast": (generateMastExport, lambda inputFile, outputFile: convert_mast_results.createSRMXML(inputFile, outputFile, processes=processes))
+  }
+  failed = False
+  with tempfile.TemporaryDirectory() as workDir:
+    for name, (generate, convert) in converters.items():
+      perFinding = []
+      for size in sizes:
+        elapsed, peak = timeConversion(name, generate(size), convert, workDir, repeat)
+        perFinding.append(elapsed / size)
+        print(f"{name}: {size} findings converted in {elapsed:.3f}s ({elapsed / size * 1000:.3f} ms/finding), peak memory {peak / 1024 / 1024:.1f} MiB")
+      # the smallest size is the baseline, with a linear converter the cost per finding should not grow with the size
+      ratio = perFinding[-1] / perFinding[0]
+      print(f"{name}: per finding cost ratio largest/smallest: {ratio:.2f}")
+      if ratio > maxRatio:
+        print(f"ERROR: {name} conversion time is not growing linearly with the number of findings (ratio {ratio:.2f} > {maxRatio})")
+        failed = True
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--sizes', default="250,500,1000,2000,4000", help='Comma separated list of finding counts to benchmark.')
+  parser.add_argument('--maxRatio', type=float, default=2.0, help='Maximum allowed ratio between the per finding cost of the largest and smallest size.')
+  parser.add_argument('--repeat', type=int, default=3, help='Number of times each size is converted, the fastest run is reported.')
+  parser.add_argument('--processes', type=int, default=1, help='Number of worker processes used by the converters, compare with 1 to measure the parallel conversion.')
+  args = parser.parse_args()
+
+  sys.exit(main([int(size) for size in args.sizes.split(",")], args.maxRatio, args.repeat, args.processes))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Offline throughput benchmark of the connector stages against the local Polaris/SRM stand in server.
+# The pull, convert and post stages are timed separately and end to end, each scenario runs in a fresh process so
+# its peak RSS is measured on its own, and the requests the stand in server received are counted per endpoint.
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+# setting path so we can include the connector scripts from the parent directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fixtures
+from stand_in_server import StandInServer
+
+def peakRSS():
+  # ru_maxrss is in KiB on linux and in bytes on macOS
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak * 1024 if sys.platform != "darwin" else peak
+
+def pullScenario(url, workDir, options):
+  import pull_dast_results
+  return pull_dast_results.main(url, "bench", os.path.join(workDir, "export.json"), "key", options["pageSize"])
+
+def convertScenario(url, workDir, options):
+  import convert_dast_results
+  return convert_dast_results.createSRMXML(os.path.join(workDir, "export.json"), os.path.join(workDir, "srm.xml"), "key", maxWorkers=options["maxWorkers"])
+
+def postScenario(url, workDir, options):
+  import srmPost
+  srmPost.main("key", url, "bench", os.path.join(workDir, "srm.xml"))
+  return options["issues"]
+
+def endToEndScenario(url, workDir, options):
+  import import_scan_results
+  import_scan_results.main("bench", url, "key", "bench-e2e", url, "key", workDir=workDir)
+  return options["issues"]
+
+SCENARIOS = {
+  "pull": pullScenario,
+  "convert": convertScenario,
+  "post": postScenario,
+  "end-to-end": endToEndScenario
+}
+
+def runScenario(name, url, workDir, options, results):
+  # runs in a child process, the scripts' own progress output is not part of the report
+  sys.stdout = open(os.devnull, 'w')
+  start = time.perf_counter()
+  cpuStart = time.process_time()
+  items = SCENARIOS[name](url, workDir, options)
+  results.put({"items": items, "wall": time.perf_counter() - start, "cpu": time.process_time() - cpuStart, "peakRSS": peakRSS()})
+
+def main(scenarios, options, reportFile=None):
+  server = StandInServer(latency=options["latencyMs"] / 1000, responseBodySize=options["responseBodySize"], maxInFlight=options["maxInFlight"], retryAfter=options["retryAfter"])
+  url = server.start()
+  server.issues = fixtures.generateDastIssues(options["issues"], evidenceUrl=url, evidencePerIssue=options["evidencePerIssue"])
+
+  # spawn so each scenario starts from a fresh interpreter, not a copy of this process and its fixtures
+  context = multiprocessing.get_context("spawn")
+  report = {"options": options, "scenarios": {}}
+  failed = False
+  with tempfile.TemporaryDirectory() as workDir:
+    for name in scenarios:
+      server.reset()
+      results = context.Queue()
+      process = context.Process(target=runScenario, args=(name, url, workDir, options, results))
+      process.start()
+      process.join()
+      if process.exitcode != 0:
+        print(f"ERROR: scenario {name} failed with exit code {process.exitcode}")
+        failed = True
+        continue
+      result = results.get()
+      result.update(server.stats())
+      result["throughput"] = options["issues"] / result["wall"] if result["wall"] > 0 else 0
+      report["scenarios"][name] = result
+      requests = ", ".join(f"{endpoint}={count}" for endpoint, count in result["requests"].items())
+      requests += f" over {result['connections']} connections"
+      print(f"{name}: {options['issues']} issues in {result['wall']:.2f}s ({result['throughput']:.0f} issues/s), cpu {result['cpu']:.2f}s, peak RSS {result['peakRSS'] / 1024 / 1024:.1f} MiB")
+      print(f"{name}: requests {requests}")
+  server.stop()
+
+  if reportFile:
+    with open(reportFile, 'w', encoding='utf-8') as f:
+      json.dump(report, f, indent=2)
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--scenarios', default="pull,convert,post,end-to-end", help='Comma separated list of scenarios to run, convert and post use the files written by the previous scenarios.')
+  parser.add_argument('--issues', type=int, default=2000, help='Number of DAST issues served by the stand in server.')
+  parser.add_argument('--evidencePerIssue', type=int, default=1, help='Number of request/response pairs per issue.')
+  parser.add_argument('--responseBodySize', type=int, default=2048, help='Size of the response bodies returned as evidence in bytes.')
+  parser.add_argument('--latencyMs', type=float, default=5, help='Delay added to every request by the stand in server in milliseconds.')
+  parser.add_argument('--pageSize', type=int, default=500, help='Number of issues per page pulled from the stand in server.')
+  parser.add_argument('--maxWorkers', type=int, default=8, help='Number of evidence downloads running at the same time during the conversion.')
+  parser.add_argument('--maxInFlight', type=int, default=0, help='Make the stand in server answer 429 while more requests than this are in flight, 0 never throttles.')
+  parser.add_argument('--retryAfter', default="1", help='Retry-After value sent with the 429 answers of --maxInFlight.')
+  parser.add_argument('--report', help='Optional, json file the results are written to.')
+  args = parser.parse_args()
+
+  options = {
+    "issues": args.issues,
+    "evidencePerIssue": args.evidencePerIssue,
+    "responseBodySize": args.responseBodySize,
+    "latencyMs": args.latencyMs,
+    "pageSize": args.pageSize,
+    "maxWorkers": args.maxWorkers,
+    "maxInFlight": args.maxInFlight,
+    "retryAfter": args.retryAfter
+  }
+  sys.exit(main(args.scenarios.split(","), options, args.report))
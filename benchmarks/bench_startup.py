@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+# Cold start benchmark for the upload entry points.
+# Imports each entry point in a fresh interpreter and checks that the time spent importing it (on top of the bare
+# interpreter start up) stays within a budget, so a heavy module level import does not sneak back into the upload path.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def coldStart(code, repeat):
+  # best of several fresh interpreters to filter out noise from other processes on the node
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+    timings.append(time.perf_counter() - start)
+  return min(timings)
+
+def main(modules, budgetMs, repeat):
+  interpreter = coldStart("pass", repeat)
+  print(f"interpreter start up: {interpreter * 1000:.0f} ms")
+  failed = False
+  for module in modules:
+    elapsed = coldStart(f"import {module}", repeat) - interpreter
+    print(f"{module}: imported in {elapsed * 1000:.0f} ms (budget {budgetMs:.0f} ms)")
+    if elapsed * 1000 > budgetMs:
+      print(f"ERROR: {module} takes longer than {budgetMs:.0f} ms to import")
+      failed = True
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--modules', default="srmPost,import_scan_results", help='Comma separated list of entry point modules to import.')
+  parser.add_argument('--budgetMs', type=float, default=250, help='Maximum allowed import time of each module in milliseconds, not counting the interpreter start up.')
+  parser.add_argument('--repeat', type=int, default=5, help='Number of fresh interpreters started per module, the fastest run is reported.')
+  args = parser.parse_args()
+
+  sys.exit(main(args.modules.split(","), args.budgetMs, args.repeat))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Correctness check for the streaming json reader used by the converters.
+# Every document is read with every chunk size from 1 to its length, so each value (numbers in particular, which
+# could continue in the next chunk) is split at every possible position, and compared with json.loads.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+# setting path so we can include the json reader from the parent directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from json_stream import JSONArrayStream
+from fixtures import generateDastExport, generateMastExport
+
+DOCUMENTS = [
+  '{"arr":[0.0001]}',
+  '{"arr":[-2.5e10]}',
+  '{"m":0.5,"arr":[1]}',
+  '{"arr":[1, 22 ,333,-4.0E-2, 1e5 ],"n":12345,"z":-0}',
+  '{"a":true,"b":null,"arr":[false,"x",{"k":[1.5,2]},[]],"c":1.25}',
+  '{ "arr" : [ ] , "after" : 10.75 }',
+  '{"arr":[]}',
+  '{}'
+]
+
+def streamed(path, arrayKey, chunkSize):
+  with JSONArrayStream(path, arrayKey, chunkSize=chunkSize) as stream:
+    items = list(stream)
+    return stream.metadata, items
+
+def expected(document, arrayKey):
+  data = json.loads(document)
+  items = data.pop(arrayKey, [])
+  return data, items
+
+def check(document, arrayKey, workDir, maxChunkSize):
+  path = os.path.join(workDir, "document.json")
+  with open(path, 'w', encoding='utf-8') as f:
+    f.write(document)
+  wanted = expected(document, arrayKey)
+  failures = 0
+  for chunkSize in range(1, min(len(document), maxChunkSize) + 1):
+    try:
+      result = streamed(path, arrayKey, chunkSize)
+    except ValueError as e:
+      result = e
+    if result != wanted:
+      print(f"ERROR: {document[:60]!r} read with chunkSize={chunkSize}: {result!r}")
+      failures += 1
+  return failures
+
+def main(maxChunkSize):
+  documents = [(document, "arr") for document in DOCUMENTS]
+  documents.append((json.dumps(generateDastExport(3)), "_items"))
+  documents.append((json.dumps(generateMastExport(3)), "findings"))
+  failures = 0
+  with tempfile.TemporaryDirectory() as workDir:
+    for document, arrayKey in documents:
+      failures += check(document, arrayKey, workDir, maxChunkSize)
+  print(f"{len(documents)} documents checked, {failures} failures")
+  return 1 if failures else 0
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--maxChunkSize', type=int, default=256, help='Largest chunk size each document is read with.')
+  args = parser.parse_args()
+
+  sys.exit(main(args.maxChunkSize))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Synthetic Polaris DAST and TORT MAST exports used by the benchmarks, the generated data has the same structure as
+# the exports written by pull_dast_results.py and the TORT json results so the converters take the same code paths.
+
+import argparse
+import base64
+import json
+
+def requestEvidence(n):
+  return (f"GET /app/page{n}?q={n} HTTP/1.1\r\n"
+          "Host: example.test\r\n"
+          "User-Agent: Mozilla/5.0\r\n"
+          "Accept: text/html\r\n"
+          "Cookie: session=0123456789abcdef\r\n\r\n").encode("utf-8")
+
+def responseEvidence(n, bodySize=2048):
+  body = f"<html><body><p>Reflected q={n}</p>" + "x" * max(0, bodySize - 50) + "</body></html>"
+  return (f"HTTP/1.1 200 OK\r\n"
+          "Content-Type: text/html; charset=utf-8\r\n"
+          f"Content-Length: {len(body)}\r\n"
+          "Server: example\r\n\r\n" + body).encode("utf-8")
+
+def encodeEvidence(data):
+  # polaris returns the request/response details base64 encoded
+  return base64.b64encode(data)
+
+def generateDastIssue(i, evidenceUrl=None, evidencePerIssue=1, evidencePool=0):
+  # evidencePool > 0 makes issues share their evidence, like issues found by the same request do on a real scan
+  evidence = []
+  if evidenceUrl:
+    for e in range(evidencePerIssue):
+      n = (i * evidencePerIssue + e) % evidencePool if evidencePool > 0 else i * evidencePerIssue + e
+      evidence.append({
+        "attack": {"payload": f"<script>alert({i})</script>"},
+        "_links": [
+          {"rel": "request", "href": f"{evidenceUrl}/evidence/{n}/request", "method": "GET"},
+          {"rel": "response", "href": f"{evidenceUrl}/evidence/{n}/response"}
+        ]
+      })
+  return {
+    "id": f"issue-{i}",
+    "type": {
+      "name": f"cross-site-scripting-{i % 20}",
+      "_localized": {
+        "name": "Cross Site Scripting",
+        "otherDetail": [
+          {"key": "description", "value": f"<p>Reflected input in parameter q{i}</p>"},
+          {"key": "remediation", "value": "<p>Encode output</p>"}
+        ]
+      }
+    },
+    "attributes": [
+      {"key": "severity", "value": "high"},
+      {"key": "cwe", "value": "CWE-79"},
+      {"key": "method", "value": "GET"},
+      {"key": "location", "value": f"https://example.test/app/page{i}?q={i}"},
+      {"key": "evidence", "value": evidence},
+      {"key": "overall-score", "value": 7.5}
+    ]
+  }
+
+def generateDastIssues(count, evidenceUrl=None, evidencePerIssue=1, evidencePool=0):
+  return [generateDastIssue(i, evidenceUrl, evidencePerIssue, evidencePool) for i in range(count)]
+
+def generateDastExport(count, evidenceUrl=None, evidencePerIssue=1, evidencePool=0):
+  # without an evidenceUrl the issues have no evidence links, so the conversion does not need a server
+  return {"_items": generateDastIssues(count, evidenceUrl, evidencePerIssue, evidencePool)}
+
+def generateMastExport(count):
+  findings = []
+  for i in range(count):
+    findings.append({
+      "identifier": i,
+      "name": f"insecure-storage-{i % 20}",
+      "description": f"Sensitive data stored in shared preferences {i}",
+      "remediation": "Use the keystore",
+      "foundBy": "Manual" if i % 2 else "Automated",
+      "cweId": "312,922",
+      "fixLocation": f"com/example/app/Storage{i}.java",
+      "risk": {"type": "Insecure Storage", "severity": "High", "impact": "High", "likelihood": "Medium"}
+    })
+  return {"generatedBy": "tort", "metadata": {"endDate": "2024-01-01", "packageName": "com.example.app"}, "findings": findings}
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('kind', choices=['dast', 'mast'], help='Type of export to generate.')
+  parser.add_argument('count', type=int, help='Number of issues/findings to generate.')
+  parser.add_argument('outputFile', help='Name of the json file to write.')
+  parser.add_argument('--evidenceUrl', help='DAST only, base URL of the evidence links, e.g. the URL of the stand in server. No evidence is generated if not set.')
+  parser.add_argument('--evidencePerIssue', type=int, default=1, help='DAST only, number of request/response pairs per issue.')
+  args = parser.parse_args()
+
+  if args.kind == 'dast':
+    export = generateDastExport(args.count, args.evidenceUrl, args.evidencePerIssue)
+  else:
+    export = generateMastExport(args.count)
+  with open(args.outputFile, 'w', encoding='utf-8') as f:
+    json.dump(export, f)
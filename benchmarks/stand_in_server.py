@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# Local HTTP stand in for the Polaris and SRM endpoints used by the connector, so the pull, convert and post stages
+# can be benchmarked offline. Every request is delayed by the configured latency and counted per endpoint. With
+# maxInFlight > 0 the server answers 429 with a Retry-After header while more requests are in flight, e.g.:
+#   server = StandInServer(fixtures.generateDastIssues(1000, evidenceUrl=...), latency=0.02)
+#   url = server.start()
+#   pull_dast_results.main(url, "bench", "export.json", "key")
+#   server.stop()
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import fixtures
+
+JSON = "application/json"
+
+class StandInServer:
+
+  def __init__(self, issues=None, latency=0.0, host="127.0.0.1", port=0, responseBodySize=2048, maxInFlight=0, retryAfter="1", jobDuration=0.0):
+    self.issues = issues or []
+    self.latency = latency
+    self.maxInFlight = maxInFlight
+    self.retryAfter = retryAfter
+    # number of seconds an analysis job is reported as running before it completes
+    self.jobDuration = jobDuration
+    self.inFlight = 0
+    self.responseBodySize = responseBodySize
+    self.lock = threading.Lock()
+    self.counts = {}
+    self.connections = 0
+    self.bytesSent = 0
+    self.bytesReceived = 0
+    self.projects = {}
+    self.addinTools = {}
+    self.secrets = {}
+    self.toolConfigs = {}
+    self.detectionMethods = []
+    self.jobs = {}
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+      # headers and body are written separately, without this every keep-alive response waits for a delayed ack
+      disable_nagle_algorithm = True
+
+      def log_message(self, *args):
+        pass
+
+      def setup(self):
+        super().setup()
+        with server.lock:
+          server.connections += 1
+
+      def do_GET(self):
+        server.handle(self, "GET")
+
+      def do_POST(self):
+        server.handle(self, "POST")
+
+      def do_PUT(self):
+        server.handle(self, "PUT")
+
+    self.httpd = ThreadingHTTPServer((host, port), Handler)
+    self.httpd.daemon_threads = True
+    self.thread = None
+
+  @property
+  def url(self):
+    host, port = self.httpd.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def start(self):
+    self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    self.thread.start()
+    return self.url
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+  def reset(self):
+    with self.lock:
+      self.counts = {}
+      self.connections = 0
+      self.bytesSent = 0
+      self.bytesReceived = 0
+
+  def stats(self):
+    with self.lock:
+      return {"requests": dict(sorted(self.counts.items())), "connections": self.connections, "bytesSent": self.bytesSent, "bytesReceived": self.bytesReceived}
+
+  def record(self, endpoint, received=0, sent=0):
+    with self.lock:
+      self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+      self.bytesReceived += received
+      self.bytesSent += sent
+
+  def readBody(self, handler):
+    # read the request body in chunks without keeping it, uploads can be large
+    remaining = int(handler.headers.get("Content-Length", 0))
+    received = 0
+    while remaining > 0:
+      chunk = handler.rfile.read(min(remaining, 1024 * 1024))
+      if not chunk:
+        break
+      remaining -= len(chunk)
+      received += len(chunk)
+    return received
+
+  def send(self, handler, code, body, contentType=JSON, headers=None):
+    data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    handler.send_response(code)
+    handler.send_header("Content-Type", contentType)
+    handler.send_header("Content-Length", str(len(data)))
+    for key, value in (headers or {}).items():
+      handler.send_header(key, value)
+    handler.end_headers()
+    handler.wfile.write(data)
+    return len(data)
+
+  def handle(self, handler, method):
+    with self.lock:
+      self.inFlight += 1
+      throttled = self.maxInFlight > 0 and self.inFlight > self.maxInFlight
+    try:
+      if self.latency > 0:
+        time.sleep(self.latency)
+      if throttled:
+        received = self.readBody(handler)
+        sent = self.send(handler, 429, {"error": "too many requests"}, JSON, {"Retry-After": self.retryAfter})
+        self.record("throttled", received, sent)
+      else:
+        self.respond(handler, method)
+    finally:
+      with self.lock:
+        self.inFlight -= 1
+
+  def respond(self, handler, method):
+    parsed = urlparse(handler.path)
+    # pull_dast_results joins the url and the endpoint with an extra slash
+    path = re.sub(r'/+', '/', parsed.path)
+    query = parse_qs(parsed.query)
+    body = {}
+    if method == "POST" and (path.endswith("/upload") or path.endswith("/analysis")):
+      received = self.readBody(handler)
+    else:
+      raw = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+      received = len(raw)
+      if raw:
+        body = json.loads(raw)
+    endpoint, code, response, contentType, headers = self.route(method, path, query, body, handler)
+    sent = self.send(handler, code, response, contentType, headers)
+    self.record(endpoint, received, sent)
+
+  def route(self, method, path, query, body, handler):
+    # returns (endpoint name, status code, response body, content type, extra headers)
+    # Polaris
+    if path == "/api/portfolio/portfolios":
+      return "polaris:portfolios", 200, {"_items": [{"id": "portfolio-1"}]}, JSON, None
+    match = re.fullmatch(r'/api/portfolio/portfolios/[^/]+/portfolio-items', path)
+    if match:
+      name = query.get("_filter", ["name=="])[0].split("==", 1)[1]
+      return "polaris:portfolio-items", 200, {"_items": [{"id": f"item-{name}"}]}, JSON, None
+    match = re.fullmatch(r'/api/portfolio/portfolio-items/([^/]+)/portfolio-sub-items', path)
+    if match:
+      return "polaris:portfolio-sub-items", 200, {"_items": [{"id": f"sub-{match.group(1)}", "subItemType": "DAST"}]}, JSON, None
+    if path == "/api/specialization-layer-service/issues/_actions/list":
+      first = int(query.get("_first", ["500"])[0])
+      cursor = int(query.get("_cursor", ["0"])[0])
+      links = []
+      if cursor + first < len(self.issues):
+        links.append({"rel": "next", "href": f"{path}?portfolioSubItemId={query.get('portfolioSubItemId', [''])[0]}&_first={first}&_cursor={cursor + first}"})
+      return "polaris:issues", 200, {"_items": self.issues[cursor:cursor + first], "_links": links}, JSON, None
+    match = re.fullmatch(r'/evidence/(\d+)/(request|response)', path)
+    if match:
+      n = int(match.group(1))
+      etag = f'"{match.group(2)}-{n}"'
+      if handler.headers.get("If-None-Match") == etag:
+        return "polaris:evidence", 304, b"", "text/plain", {"ETag": etag}
+      data = fixtures.requestEvidence(n) if match.group(2) == "request" else fixtures.responseEvidence(n, self.responseBodySize)
+      return "polaris:evidence", 200, fixtures.encodeEvidence(data), "text/plain", {"ETag": etag}
+
+    # SRM
+    if path == "/srm/api/projects" and method == "GET":
+      return "srm:projects", 200, {"projects": [{"id": i, "name": n} for n, i in self.projects.items()]}, JSON, None
+    if path == "/srm/api/projects" and method == "POST":
+      with self.lock:
+        projectId = self.projects.setdefault(body.get("name"), len(self.projects) + 1)
+      return "srm:create-project", 201, {"id": projectId}, JSON, None
+    if path == "/srm/api/projects/query":
+      name = body.get("filter", {}).get("name", "").lower()
+      return "srm:projects-query", 200, [{"id": i, "name": n} for n, i in self.projects.items() if name in n.lower()], JSON, None
+    if re.fullmatch(r'/srm/api/projects/\d+/analysis', path):
+      return "srm:upload", 202, {"jobId": self.createJob()}, JSON, None
+    match = re.fullmatch(r'/srm/x/projects/\d+/branches', path)
+    if match:
+      return "srm:branches", 200, [{"name": "main", "isDefault": True}], JSON, None
+    if path == "/srm/api/analysis-prep":
+      return "srm:analysis-prep", 200, {"prepId": f"prep-{time.time_ns()}"}, JSON, None
+    if re.fullmatch(r'/srm/x/analysis-prep/[^/]+/branch', path):
+      return "srm:analysis-prep-branch", 200, {}, JSON, None
+    if re.fullmatch(r'/srm/api/analysis-prep/[^/]+/upload', path):
+      return "srm:analysis-prep-upload", 202, {}, JSON, None
+    if re.fullmatch(r'/srm/api/analysis-prep/[^/]+/analyze', path):
+      jobId = self.createJob()
+      return "srm:analyze", 202, {"jobId": jobId, "analysisId": len(self.jobs)}, JSON, None
+    if path == "/srm/api/detection-methods" and method == "GET":
+      return "srm:detection-methods", 200, [{"id": i + 1, "name": n} for i, n in enumerate(self.detectionMethods)], JSON, None
+    if path == "/srm/api/detection-methods" and method == "POST":
+      with self.lock:
+        if body.get("name") not in self.detectionMethods:
+          self.detectionMethods.append(body.get("name"))
+        methodId = self.detectionMethods.index(body.get("name")) + 1
+      return "srm:create-detection-method", 200, {"id": methodId}, JSON, None
+    if path == "/srm/x/admin/addin-tools" and method == "GET":
+      return "srm:addin-tools", 200, [{"id": i, "name": n} for n, i in self.addinTools.items()], JSON, None
+    if path == "/srm/x/admin/addin-tools" and method == "POST":
+      with self.lock:
+        toolId = self.addinTools.setdefault(body.get("name"), len(self.addinTools) + 1)
+      return "srm:create-addin-tool", 200, {"id": toolId}, JSON, None
+    match = re.fullmatch(r'/srm/x/toolservice/secrets/(\d+)', path)
+    if match and method == "GET":
+      return "srm:secrets", 200, [{"name": n} for n in self.secrets.get(match.group(1), [])], JSON, None
+    if match and method == "POST":
+      with self.lock:
+        self.secrets.setdefault(match.group(1), []).append(body.get("name"))
+      return "srm:create-secret", 200, {}, JSON, None
+    match = re.fullmatch(r'/srm/x/toolservice/addin-tools/(\d+)/(\d+)', path)
+    if match and method == "POST":
+      with self.lock:
+        self.toolConfigs[match.groups()] = body
+      return "srm:configure-tool", 200, {}, JSON, None
+    match = re.fullmatch(r'/srm/api/jobs/([^/]+)', path)
+    if match:
+      started = self.jobs.get(match.group(1))
+      if started is None:
+        return "srm:jobs", 404, {"error": "job not found"}, JSON, None
+      status = "completed" if time.time() - started >= self.jobDuration else "running"
+      return "srm:jobs", 200, {"jobId": match.group(1), "status": status}, JSON, None
+    return "unknown", 404, {"error": f"no stand in for {method} {path}"}, JSON, None
+
+  def createJob(self):
+    with self.lock:
+      jobId = f"job-{len(self.jobs) + 1}"
+      self.jobs[jobId] = time.time()
+    return jobId
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--issues', type=int, default=1000, help='Number of DAST issues served by the issues endpoint.')
+  parser.add_argument('--latencyMs', type=float, default=0, help='Delay added to every request in milliseconds.')
+  parser.add_argument('--port', type=int, default=8800, help='Port to listen on.')
+  parser.add_argument('--maxInFlight', type=int, default=0, help='Answer 429 while more requests than this are in flight, 0 never throttles.')
+  args = parser.parse_args()
+
+  url = f"http://127.0.0.1:{args.port}"
+  server = StandInServer(fixtures.generateDastIssues(args.issues, evidenceUrl=url), args.latencyMs / 1000, port=args.port, maxInFlight=args.maxInFlight)
+  server.start()
+  print(f"Polaris and SRM stand in listening on {url}, press Ctrl+C to stop")
+  try:
+    server.thread.join()
+  except KeyboardInterrupt:
+    server.stop()
+    sys.exit(0)
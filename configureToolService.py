@@ -1,26 +1,36 @@
 #!/usr/bin/env python3
 
+import hashlib
 import json
 import os
 import pprint
-import requests
+import srm_client
 import argparse
 import sys
-from srmPost import get_existing_projects, create_project
+from concurrent.futures import ThreadPoolExecutor
+from srmPost import find_project, create_project, project_index, ProjectLookupError
+from lookup_cache import LookupCache
+from project_manifest import loadManifest
 
+# name of the project secret that holds the polaris api key
+POLARIS_SECRET_NAME = "polariskey"
 
 def get_project_id(api_url, headers, srmProjectName):
     print(f"Checking if {srmProjectName} exists...")
-    existing_projects = {k.lower(): v for k, v in get_existing_projects(api_url, headers).items()}
-    if srmProjectName.lower() not in existing_projects:
+    try:
+        project_id = find_project(api_url, srmProjectName, headers)
+    except ProjectLookupError as e:
+        print(f"ERROR: {e}")
+        return None
+    if project_id is None:
         print(f"{srmProjectName} does not exists, creating new project...")
         return create_project(api_url, srmProjectName, headers)
     else:
         print(f"{srmProjectName} found...")
-        return existing_projects[srmProjectName.lower()]
+        return project_id
 
 def get_addin_tool_id(api_url, headers, tool_name):
-    response = requests.get(f"{api_url}srm/x/admin/addin-tools", headers=headers)
+    response = srm_client.getClient(api_url, headers).get("srm/x/admin/addin-tools")
     if response.status_code != 200:
         print("ERROR: Failed to create add-in tool, HTTP Response: " + str(response.status_code))
         print("ERROR: Error Message: " + response.text)
@@ -41,7 +51,7 @@ def create_addin_tool(api_url, headers, tool_name):
         "acceptedTags":[],
         "toolDeclaration": scanRequestFile
         }
-    response = requests.post(f"{api_url}srm/x/admin/addin-tools",  json=jsonBody, headers=headers)
+    response = srm_client.getClient(api_url, headers).post("srm/x/admin/addin-tools", json=jsonBody)
     if response.status_code != 200:
         print("ERROR: Failed to create add-in tool, HTTP Response: " + str(response.status_code))
         print("ERROR: Error Message: " + response.text)
@@ -49,9 +59,9 @@ def create_addin_tool(api_url, headers, tool_name):
         print("Successfully created add in tool")
         return response.json()['id']
 
-def add_project_secret(srmURL, headers, secretValue, projectId, secretName="polariskey", secretKey="apikey"):
+def add_project_secret(srmURL, headers, secretValue, projectId, secretName=POLARIS_SECRET_NAME, secretKey="apikey"):
     # first check to make sure secret doesn't already exist
-    response = requests.get(f"{srmURL}srm/x/toolservice/secrets/{projectId}", headers=headers)
+    response = srm_client.getClient(srmURL, headers).get(f"srm/x/toolservice/secrets/{projectId}")
     secretId="-1"
     if response.status_code != 200:
         print("ERROR: Failed to get project secrets, HTTP Response: " + str(response.status_code))
@@ -74,7 +84,7 @@ def add_project_secret(srmURL, headers, secretValue, projectId, secretName="pola
                 }
             ]
         }
-        response = requests.post(f"{srmURL}srm/x/toolservice/secrets/{projectId}", json=jsonBody, headers=headers)
+        response = srm_client.getClient(srmURL, headers).post(f"srm/x/toolservice/secrets/{projectId}", json=jsonBody)
         if response.status_code != 200:
             print("ERROR: Failed to create project secret, HTTP Response: " + str(response.status_code))
             print("ERROR: Error Message: " + response.text)
@@ -83,41 +93,115 @@ def add_project_secret(srmURL, headers, secretValue, projectId, secretName="pola
             return secretName       
 
 
-def configure_tool_service(srmURL, headers, projectId, toolId, polarisApiKey, polarisURL, polarisProjectName):
+def configure_tool_service(srmURL, headers, projectId, toolId, polarisApiKey, polarisURL, polarisProjectName, configCache=None):
+    # Add tool configuration
+    tomlConfig=f"[polaris]\nproject=\"{polarisProjectName}\"\nurl=\"{polarisURL}\""
+
+    # with a config cache, a project whose tool config was already applied with the same settings is skipped.
+    # The api key is kept out of the cache file, the config refers to the project secret by name and an existing
+    # secret is reused as is, so the secret name is what identifies it.
+    cacheKey = f"{srmURL}|{projectId}|{toolId}"
+    fingerprint = hashlib.sha256(f"{tomlConfig}|{POLARIS_SECRET_NAME}".encode("utf-8")).hexdigest()
+    if configCache is not None and configCache.get(cacheKey) == fingerprint:
+        print("Tool config for project: "+str(projectId)+" is already up to date, skipping")
+        return True
+
     # Add project secret
     secretId = add_project_secret(srmURL, headers, polarisApiKey, projectId)
 
-    # Add tool configuration
-    tomlConfig=f"[polaris]\nproject=\"{polarisProjectName}\"\nurl=\"{polarisURL}\""
     jsonBody = {
         "newContent": tomlConfig,
         "allowedSecrets": [ secretId ],
         "isEnabled": True
     }
-    response = requests.post(f"{srmURL}srm/x/toolservice/addin-tools/{projectId}/{toolId}", json=jsonBody, headers=headers)
+    response = srm_client.getClient(srmURL, headers).post(f"srm/x/toolservice/addin-tools/{projectId}/{toolId}", json=jsonBody)
     if response.status_code != 200:
         print("ERROR: Failed to configure tool configuration for project: "+str(projectId)+", HTTP Response: " + str(response.status_code))
         print("ERROR: Error Message: " + response.text)
+        return False
     else:
         print("Successfully configured tool config for project: "+str(projectId))
+        if configCache is not None and secretId is not None:
+            configCache.set(cacheKey, fingerprint)
+        return True
 
-def main(apiKey, srmURL, polarisProjectName, srmProjectName, polarisURL, addInToolName, polarisApiKey):
-    headers = {'Authorization': 'Bearer ' + apiKey}
-
-    # add trailing slash to srm url if needed:
-    if not srmURL.endswith("/"):
-        srmURL += "/"
-    
+def get_or_create_addin_tool(srmURL, headers, addInToolName):
     # Configure add in tool if it doesn't already exist
     toolId = get_addin_tool_id(srmURL, headers, addInToolName)
     if toolId == "-1":
         print("Creating add in tool...")
         toolId = create_addin_tool(srmURL, headers, addInToolName)
+    return toolId
+
+def main(apiKey, srmURL, polarisProjectName, srmProjectName, polarisURL, addInToolName, polarisApiKey, configCache=None):
+    headers = {'Authorization': 'Bearer ' + apiKey}
+
+    srmURL = srm_client.normalizeURL(srmURL)
+    
+    toolId = get_or_create_addin_tool(srmURL, headers, addInToolName)
 
     # Check if SRM project name exists, if not create it
     project_id = get_project_id(srmURL, headers, srmProjectName)
+    if project_id is None:
+        print("ERROR: Failed to find or create the SRM project: "+srmProjectName)
+        return False
 
-    configure_tool_service(srmURL, headers, project_id, toolId, polarisApiKey, polarisURL, polarisProjectName)
+    return configure_tool_service(srmURL, headers, project_id, toolId, polarisApiKey, polarisURL, polarisProjectName, configCache)
+
+def configure_projects(apiKey, srmURL, mappingFile, polarisURL, addInToolName, polarisApiKey, workers=8, configCache=None):
+    # Bulk mode: configures every Polaris -> SRM project pair of the mapping file (same format as the
+    # import_scan_results.py --manifest file). The add-in tool and the SRM project list are looked up once for
+    # the whole mapping, then the missing projects, secrets and tool configs are created by a bounded pool of workers.
+    headers = {'Authorization': 'Bearer ' + apiKey}
+    srmURL = srm_client.normalizeURL(srmURL)
+
+    # the same SRM project mapped more than once would be created and configured twice at the same time, the last mapping wins
+    projects = {}
+    for polarisProjectName, srmProjectName in loadManifest(mappingFile):
+        if srmProjectName.lower() in projects:
+            print(f"WARNING: SRM project {srmProjectName} is mapped more than once, using Polaris project {polarisProjectName}")
+        projects[srmProjectName.lower()] = (polarisProjectName, srmProjectName)
+    projects = list(projects.values())
+    print(f"Configuring {len(projects)} projects with {workers} workers...")
+
+    toolId = get_or_create_addin_tool(srmURL, headers, addInToolName)
+    if toolId is None:
+        print("ERROR: Failed to get or create the add in tool: "+addInToolName)
+        return len(projects)
+
+    # one download of the full project list instead of one lookup per project
+    project_index.refresh(srmURL, headers)
+
+    def configure(project):
+        polarisProjectName, srmProjectName = project
+        error = None
+        try:
+            # projects missing from the list are looked up once more before they are created, in case the list failed to download
+            project_id = project_index.get(srmURL, srmProjectName)
+            if project_id is None:
+                project_id = get_project_id(srmURL, headers, srmProjectName)
+            if project_id is None:
+                error = "failed to find or create the SRM project"
+            elif not configure_tool_service(srmURL, headers, project_id, toolId, polarisApiKey, polarisURL, polarisProjectName, configCache):
+                error = "failed to configure the tool"
+        except (Exception, SystemExit) as e:
+            # one failing project should not abort the rest of the mapping
+            error = f"{type(e).__name__}: {e}"
+        return polarisProjectName, srmProjectName, error
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(configure, projects))
+
+    print("Bulk configuration summary:")
+    failed = 0
+    for polarisProjectName, srmProjectName, error in results:
+        if error is None:
+            print(f"  OK     {polarisProjectName} -> {srmProjectName}")
+        else:
+            failed += 1
+            print(f"  FAILED {polarisProjectName} -> {srmProjectName}: {error}")
+    print(f"{len(results) - failed} of {len(results)} projects configured successfully.")
+    return failed
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -128,12 +212,25 @@ if __name__ == '__main__':
     parser.add_argument('--srmURL', default=os.environ.get('SRM_URL'), help='URL for SRM')
     parser.add_argument('--apiKey', default=os.environ.get('SRM_API_KEY'), help='SRM API key for authentication')
     parser.add_argument('--addInToolName', default="Polaris DAST", help='Name of the add in tool to create, or assign to the project if it already exists')
+    parser.add_argument('--mappingFile', help='Optional, json or toml file mapping several Polaris projects to SRM projects (same format as the import_scan_results.py --manifest file), configures all of them in one run instead of --polarisProjectName and --srmProjectName')
+    parser.add_argument('--workers', type=int, default=8, help='Number of projects configured at the same time with --mappingFile')
+    parser.add_argument('--configCacheFile', default=os.environ.get('SRM_TOOL_CONFIG_CACHE_FILE'), help='Optional, file used to remember the tool configs applied to the projects, projects already configured with the same settings are skipped. Without it every project is configured again on each run')
+    parser.add_argument('--configCacheTTLHours', type=float, default=168, help='Number of hours an applied tool config is remembered before it is applied again')
     args = parser.parse_args()
 
-    srmProjectName = ""
-    if args.srmProjectName is None:
-        srmProjectName = args.polarisProjectName
-    else:
-        srmProjectName = args.srmProjectName
-        
-    main(args.apiKey, args.srmURL, args.polarisProjectName, srmProjectName, args.polarisURL, args.addInToolName, args.polarisApiKey)
+    configCache = LookupCache(args.configCacheFile, args.configCacheTTLHours * 3600) if args.configCacheFile else None
+    try:
+        if args.mappingFile:
+            failed = configure_projects(args.apiKey, args.srmURL, args.mappingFile, args.polarisURL, args.addInToolName, args.polarisApiKey, args.workers, configCache)
+            sys.exit(1 if failed else 0)
+
+        srmProjectName = ""
+        if args.srmProjectName is None:
+            srmProjectName = args.polarisProjectName
+        else:
+            srmProjectName = args.srmProjectName
+
+        main(args.apiKey, args.srmURL, args.polarisProjectName, srmProjectName, args.polarisURL, args.addInToolName, args.polarisApiKey, configCache)
+    finally:
+        # close the pooled SRM connections
+        srm_client.closeClients()
@@ -1,177 +1,433 @@
 #!/usr/bin/env python3
 
 from datetime import datetime
-import json
 import os
-import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from collections import OrderedDict
+import hashlib
+import threading
 import argparse
 import base64
 from random import choice
 import pprint
 import xml.etree.ElementTree as ET
 from urllib.parse import urlparse
-from email.parser import BytesParser
-import xml.dom.minidom
+from srm_xml_writer import SRMXMLWriter
+from field_mapping import Field, FieldMapping, Description
+from evidence_cache import EvidenceCache
+from sync_state import SyncState
+from json_stream import openArray
+import run_metrics
+import parallel_convert
+import http_client
 
-def getLinkData(url, apiKey):
+def createSession(maxConnectionsPerHost=8):
+  # keep-alive session shared by all evidence requests, pool_block caps the open connections per host and the
+  # limiter lowers the requests in flight below that when polaris starts throttling
+  session = http_client.RetryingSession(limiter=http_client.AdaptiveLimiter(maxConnectionsPerHost))
+  adapter = HTTPAdapter(pool_connections=4, pool_maxsize=maxConnectionsPerHost, pool_block=True)
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return run_metrics.instrument(session)
+
+def getLinkData(url, apiKey, session=None, cache=None):
   headers = {'Api-token': apiKey}
-  response = requests.get(f"{url}", headers=headers)
+  cachedData = None
+  if cache is not None:
+    cachedData, etag, fresh = cache.lookup(url)
+    if cachedData is not None and fresh:
+      cache.record("hit")
+      return cachedData
+    # cached but expired, ask polaris if it changed
+    if cachedData is not None and etag:
+      headers['If-None-Match'] = etag
+
+  response = (session or http_client).get(f"{url}", headers=headers)
 
-  if response.status_code == 200:
-    return base64.b64decode(response.text)
+  if response.status_code == 304 and cachedData is not None:
+    cache.refresh(url, cachedData, response.headers.get("ETag", etag))
+    return cachedData
+  elif response.status_code == 200:
+    # decode the raw bytes, response.text would first guess the charset and copy the whole blob into a str
+    data = base64.b64decode(response.content)
+    if cache is not None:
+      cache.record("miss")
+      cache.put(url, data, response.headers.get("ETag"))
+    return data
   else:
     print("ERROR: Failed to retrieve request response details")
-    return ""
+    return None
+
+def collectEvidenceLinks(issues):
+  # Get the unique request/response hrefs of every evidence item, in the order they appear
+  hrefs = {}
+  for issue in issues:
+    for attribute in issue.get("attributes", []):
+      if attribute.get("key") != "evidence":
+        continue
+      for evidence in attribute.get("value") or []:
+        for link in evidence.get("_links", []):
+          if link.get("rel") in ("request", "response"):
+            hrefs[link.get("href")] = True
+  return list(hrefs)
+
+def fetchEvidence(hrefs, apiKey, session, maxWorkers=8, cache=None):
+  # Download the evidence blobs concurrently, returns a dict of href -> decoded bytes, the hrefs that could not be
+  # downloaded are left out (their request/response is written empty)
+  if not hrefs:
+    return {}
+  with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+    blobs = executor.map(lambda href: getLinkData(href, apiKey, session, cache), hrefs)
+    return {href: blob for href, blob in zip(hrefs, blobs) if blob is not None}
+
+def hasFailedEvidence(issue, failed):
+  # True if some of the evidence of the issue could not be downloaded, its finding should not be kept by the sync state
+  return bool(failed) and any(href in failed for href in collectEvidenceLinks([issue]))
+
+def splitHTTPMessage(blob):
+  # Splits a raw http request/response into its head (start line and headers) and body at the first empty line,
+  # CRLF or bare LF. Both parts are memoryviews of the blob, so the body is never copied or decoded and binary
+  # bodies are kept byte for byte.
+  view = memoryview(blob)
+  crlf = blob.find(b"\r\n\r\n")
+  lf = blob.find(b"\n\n")
+  if lf != -1 and (crlf == -1 or lf < crlf):
+    return view[:lf], view[lf + 2:]
+  if crlf != -1:
+    return view[:crlf], view[crlf + 4:]
+  return view, view[len(blob):]
+
+class EvidenceEncoder:
+  # Turns the request/response blobs downloaded from polaris into the headers and base64 body of the SRM XML
+  # elements. The same error page or login redirect often shows up behind dozens of issues, so blobs are
+  # recognized by their sha256 and each distinct blob is only parsed and encoded once per run. Hrefs encoded by an
+  # earlier batch are not downloaded again (see missing()). Bodies longer than maxBodySize bytes are cut to that
+  # size and marked truncated. trim() keeps the memo to maxBytes of blobs (and maxHrefs hrefs), least recently used
+  # are dropped first. It is only called between batches, so a blob skipped by missing() is still there when it is used.
+  def __init__(self, maxBodySize=None, maxBytes=64 * 1024 * 1024, maxHrefs=100000):
+    self.maxBodySize = maxBodySize or None
+    self.maxBytes = maxBytes
+    self.maxHrefs = maxHrefs
+    self.size = 0
+    self.entries = OrderedDict()
+    self.hrefs = OrderedDict()
+    self.lock = threading.Lock()
+    self.encoded = 0
+    self.reused = 0
+
+  def missing(self, hrefs):
+    # the hrefs whose encoded blob is not in the memo and need to be downloaded
+    with self.lock:
+      return [href for href in hrefs if self.hrefs.get(href) not in self.entries]
+
+  def encodeBody(self, data):
+    # data is bytes or a memoryview, returns (body base64 encoded, truncated)
+    truncated = self.maxBodySize is not None and len(data) > self.maxBodySize
+    if truncated:
+      data = data[:self.maxBodySize]
+    return base64.b64encode(data).decode("ascii"), truncated
+
+  def storedLength(self, length):
+    # number of bytes of a body of length bytes kept in the SRM XML
+    return length if self.maxBodySize is None else min(length, self.maxBodySize)
+
+  def encodeRequest(self, blob):
+    return blob.decode("utf-8", "replace")
+
+  def encodeResponse(self, blob):
+    # Polaris puts the status line, headers and body in one big blob, only the head is decoded to text
+    head, body = splitHTTPMessage(blob)
+    headers = bytes(head).decode("utf-8", "replace").replace("\r\n", "\n")
+    originalBodyLength = str(len(body))
+    encodedBody, truncated = self.encodeBody(body)
+    # get response code
+    statusLine = headers.split("\n", 1)[0].split(" ")
+    respCode = statusLine[1] if len(statusLine) > 1 else ""
+    # same header text as the email parser used to produce, the start line is preceded by an empty line
+    headers = "\n" + headers
+    return respCode, headers, originalBodyLength, encodedBody, truncated
+
+  def lookup(self, kind, href, blobs):
+    # kind is "request" or "response", blobs are the blobs downloaded for the current batch
+    with self.lock:
+      key = self.hrefs.get(href)
+      if key is not None and key[0] == kind and key in self.entries:
+        self.hrefs.move_to_end(href)
+        self.entries.move_to_end(key)
+        self.reused += 1
+        return self.entries[key][0]
+    blob = blobs.get(href, b"")
+    key = (kind, hashlib.sha256(blob).digest())
+    with self.lock:
+      self.hrefs[href] = key
+      self.hrefs.move_to_end(href)
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        self.reused += 1
+        return self.entries[key][0]
+    value = self.encodeRequest(blob) if kind == "request" else self.encodeResponse(blob)
+    with self.lock:
+      self.encoded += 1
+      if key not in self.entries:
+        self.entries[key] = (value, len(blob))
+        self.size += len(blob)
+    return value
+
+  def trim(self):
+    with self.lock:
+      while self.size > self.maxBytes and self.entries:
+        key, (value, size) = self.entries.popitem(last=False)
+        self.size -= size
+      while len(self.hrefs) > self.maxHrefs:
+        self.hrefs.popitem(last=False)
+
+  def report(self):
+    print(f"Evidence encoding: {self.encoded} distinct blobs encoded, {self.reused} reused")
 
+class RecentBlobs:
+  # The evidence blobs downloaded for the last batches of the parallel conversion, up to maxBytes (least recently
+  # used are dropped first). The workers do not share an EvidenceEncoder, so the parent keeps the raw blobs instead
+  # to not download again the evidence shared by several batches.
+  def __init__(self, maxBytes=64 * 1024 * 1024):
+    self.maxBytes = maxBytes
+    self.size = 0
+    self.blobs = OrderedDict()
 
-def createSRMXML(inputFile,outputFile,apiKey):
+  def missing(self, hrefs):
+    return [href for href in hrefs if href not in self.blobs]
+
+  def select(self, hrefs, downloaded):
+    # the blobs of the hrefs, from the downloaded ones or the ones kept from the earlier batches
+    selected = {}
+    for href in hrefs:
+      blob = downloaded.get(href)
+      if blob is not None:
+        self.blobs[href] = blob
+        self.size += len(blob)
+      elif href in self.blobs:
+        blob = self.blobs[href]
+        self.blobs.move_to_end(href)
+      else:
+        # the download failed
+        continue
+      selected[href] = blob
+    while self.size > self.maxBytes and self.blobs:
+      href, blob = self.blobs.popitem(last=False)
+      self.size -= len(blob)
+    return selected
+
+def cweNumber(cwe):
+  # just get ID number
+  parts = cwe.split("-")
+  return parts[1] if len(parts) > 1 else ""
+
+def splitLocation(location):
+  location = urlparse(location)
+  return location.path, location.query
+
+# Where the SRM finding fields come from in a Polaris DAST issue
+MAPPING = FieldMapping({
+  "nativeToolId": Field("id"),
+  "toolCode": Field("type.name"),
+  "nativeToolName": Field("type._localized.name"),
+  # get data from "other details section"
+  "description": Field("type._localized.otherDetail[description]"),
+  "remediation": Field("type._localized.otherDetail[remediation]"),
+  # get data from attributes section
+  "severity": Field("attributes[severity]"),
+  "cweID": Field("attributes[cwe]", transform=cweNumber),
+  ("locationPath", "locationQuery"): Field("attributes[location]", transform=splitLocation),
+  # just store the evidence data for now, we will dynamically write the XML later
+  "evidenceData": Field("attributes[evidence]", default=[]),
+  "overallScore": Field("attributes[overall-score]"),
+  "scores": Field("attributes[scores]"),
+  # add additional items to description
+  "descriptionHTML": Description([("Remediation", "remediation"), ("Overall Score", "overallScore"), ("Scores", "scores")])
+})
+
+def createFinding(issue, toolName, evidenceBlobs, encoder=None):
+  # Get all top level info:
+  findingCategory="Security"
+  fields = MAPPING.extract(issue)
+  locationPath = fields["locationPath"]
+  locationQuery = fields["locationQuery"]
+
+  # Now that we have all the data lets build the XML finding, child elements are added in the order srm_input.xsd expects
+  finding = ET.Element('finding', severity=fields["severity"], type='dynamic')
+  nativeTool = ET.SubElement(finding, 'native-id', name=fields["nativeToolName"], value=fields["nativeToolId"])
+  cwe = ET.SubElement(finding, 'cwe', id=fields["cweID"])
+  tool = ET.SubElement(finding, 'tool', name=toolName, category=findingCategory, code=fields["toolCode"])
+  location = ET.SubElement(finding, 'location', type='url', path=locationPath)
+  variants = ET.SubElement(location, 'variants')
+  descriptionXML = ET.SubElement(finding, 'description', {'format': 'html', 'include-in-hash': 'false'})
+  descriptionXML.text = fields["descriptionHTML"]
+
+  if encoder is None:
+    encoder = EvidenceEncoder()
+  # Loop through evidence and add variants to xml
+  for evidence in fields["evidenceData"]:
+    variant_element = ET.SubElement(variants, 'variant')
+    bodyText = evidence.get("attack").get("payload","")
+    links = evidence.get("_links")
+    # loop through links here:
+    for link in links:
+      if link.get("rel") == "request":
+        # Create the request element with method, path, and query attributes
+        rr_element = ET.Element('request', method=link.get("method", ''), path=locationPath, query=locationQuery)
+        headerText = encoder.lookup("request", link.get("href"), evidenceBlobs)
+        header_element = ET.SubElement(rr_element, 'headers')
+        header_element.text = headerText
+        bodyData = bodyText.encode()
+        body, truncated = encoder.encodeBody(bodyData)
+        # both lengths are byte counts, length is what is left after truncation
+        body_element = ET.SubElement(rr_element, 'body', {'truncated': str(truncated).lower(), 'original-length': str(len(bodyData)), 'length': str(encoder.storedLength(len(bodyData)))})
+        body_element.text = body
+        #print(body_element.text)
+        variant_element.append(rr_element)
+      elif link.get("rel") == "response":
+        # get data fetched from polaris, parsed and encoded once per distinct blob
+        resp_code, headers, originalBodyLength, body, truncated = encoder.lookup("response", link.get("href"), evidenceBlobs)
+        rr_element = ET.Element("response", code=resp_code)
+        header_element = ET.SubElement(rr_element, 'headers')
+        header_element.text = headers
+        body_element = ET.SubElement(rr_element, 'body', {'truncated': str(truncated).lower(), 'original-length': originalBodyLength, 'length': str(encoder.storedLength(int(originalBodyLength)))})
+        body_element.text = body
+        variant_element.append(rr_element)
+
+  return finding
+
+def pendingBatches(issues, batchSize, state, variant, indent):
+  # yields the issues in batches of (issue, fingerprint, fragment), the fragment of the issues that did not change
+  # since the last import is reused from the sync state, it is None for the issues that need to be converted
+  while True:
+    batch = list(islice(issues, batchSize))
+    if not batch:
+      break
+    pending = []
+    for issue in batch:
+      fingerprint = fragment = None
+      if state is not None:
+        fingerprint = state.fingerprint(issue, variant)
+        fragment = state.getFragment(issue.get("id"), fingerprint, indent)
+      pending.append((issue, fingerprint, fragment))
+    yield pending
+
+def buildFragments(issues, toolName, evidenceBlobs, indent, maxBodySize):
+  # Runs in the worker processes of the parallel conversion, returns the serialized findings in the order of the issues
+  encoder = EvidenceEncoder(maxBodySize)
+  writer = SRMXMLWriter(None, None, None, indent)
+  return [writer.serializeFinding(createFinding(issue, toolName, evidenceBlobs, encoder)) for issue in issues]
+
+def convertIssues(issues,outputFile,apiKey,indent=True,maxWorkers=8,maxConnectionsPerHost=8,batchSize=100,cache=None,state=None,session=None,maxBodySize=None,processes=1):
+  # Convert any iterable of issues (a loaded export, or the issues streamed from polaris by pull_dast_results.streamIssues)
+  # only one batch of issues is held in memory at a time. Returns the number of findings written.
+  # With processes > 1 the findings of each batch are built in worker processes while the next batches are downloaded.
   toolName="fAST-DAST"
-  # Load JSON data
-  with open(inputFile, 'r', encoding='utf-8') as f:
-    json_data = json.load(f)
-  
-  #Load Issues
-  issues = json_data.get("_items", [0])
-  #pprint.pprint(issues, compact=True)
-
-  # Ensure the vulnerabilities data is a list
-  if not isinstance(issues, list):
-      raise ValueError("No Issues Found In the Input File.")  
+  issues = iter(issues)
+  encoder = EvidenceEncoder(maxBodySize)
+  # a different body size cap changes the findings, so it is part of the fingerprint of the issues
+  variant = f"maxBodySize={encoder.maxBodySize}" if encoder.maxBodySize else ""
+  # the hrefs whose download failed during this run
+  failed = set()
+
+  # Open the report with 'date' and 'tool' attributes, each finding is streamed to the file as soon as it is built
+  ownSession = session is None
+  if ownSession:
+    session = createSession(maxConnectionsPerHost)
+  with SRMXMLWriter(outputFile, date=datetime.now().strftime('%Y-%m-%d'), tool=toolName, indent=indent) as writer:
+    batches = pendingBatches(issues, batchSize, state, variant, indent)
+    if processes > 1:
+      writeParallel(writer, batches, toolName, apiKey, session, maxWorkers, cache, state, indent, encoder.maxBodySize, processes, failed)
+    else:
+      # Work through the issues in batches, the evidence of a whole batch is fetched concurrently before its findings are built
+      for pending in batches:
+        changedIssues = [issue for issue, fingerprint, fragment in pending if fragment is None]
+        with run_metrics.stage("evidence fetch"):
+          hrefs = encoder.missing(collectEvidenceLinks(changedIssues))
+          evidenceBlobs = fetchEvidence(hrefs, apiKey, session, maxWorkers, cache)
+          failed.update(href for href in hrefs if href not in evidenceBlobs)
+        # Loop through issues and populate the SRM findings field
+        for issue, fingerprint, fragment in pending:
+          if fragment is None:
+            with run_metrics.stage("xml build"):
+              finding = createFinding(issue, toolName, evidenceBlobs, encoder)
+            with run_metrics.stage("serialization"):
+              fragment = writer.serializeFinding(finding)
+            saveFragment(state, issue, fingerprint, indent, fragment, failed)
+          with run_metrics.stage("serialization"):
+            writer.writeFragment(fragment)
+        encoder.trim()
+      encoder.report()
+  if ownSession:
+    session.close()
+  if failed and state is not None:
+    print(f"ERROR: {len(failed)} request/response details could not be retrieved, the issues using them will be converted again by the next run.")
+
+  if cache is not None:
+    cache.evict()
+    cache.report()
+  return writer.findingCount
+
+def saveFragment(state, issue, fingerprint, indent, fragment, failed):
+  # the finding of an issue whose evidence could not be downloaded is written to the report but not remembered,
+  # so the next run downloads the evidence again instead of reusing the empty request/response
+  if state is None:
+    return
+  if hasFailedEvidence(issue, failed):
+    state.forget(issue.get("id"))
   else:
-    print(f"Converting issues to SRM XML format...")
+    state.saveFragment(fingerprint, indent, fragment)
 
-  # Create a new root element 'report' with 'date' and 'tool' attributes
-  report = ET.Element('report', date=datetime.now().strftime('%Y-%m-%d'), tool=toolName)
-  findings = ET.SubElement(report, 'findings')
+def writeParallel(writer, batches, toolName, apiKey, session, maxWorkers, cache, state, indent, maxBodySize, processes, failed):
+  # The parent downloads the evidence of the batches and writes the findings, the workers build and serialize them.
+  recent = RecentBlobs()
+  def tasks():
+    for pending in batches:
+      changedIssues = [issue for issue, fingerprint, fragment in pending if fragment is None]
+      hrefs = collectEvidenceLinks(changedIssues)
+      with run_metrics.stage("evidence fetch"):
+        missing = recent.missing(hrefs)
+        downloaded = fetchEvidence(missing, apiKey, session, maxWorkers, cache)
+        failed.update(href for href in missing if href not in downloaded)
+        evidenceBlobs = recent.select(hrefs, downloaded)
+      yield pending, (changedIssues, toolName, evidenceBlobs, indent, maxBodySize)
+  for pending, fragments in parallel_convert.mapOrdered(buildFragments, tasks(), processes):
+    fragments = iter(fragments)
+    for issue, fingerprint, fragment in pending:
+      if fragment is None:
+        fragment = next(fragments)
+        saveFragment(state, issue, fingerprint, indent, fragment, failed)
+      with run_metrics.stage("serialization"):
+        writer.writeFragment(fragment)
 
-  # Loop through issues and populate the SRM findings field
-  for issue in issues:
-    # Get all top level info:
-    findingCategory="Security"
-    nativeToolId=issue.get("id")
-    toolCode=issue.get("type").get("name")
-    nativeToolName=issue.get("type").get("_localized").get("name")
-    otherDetails=issue.get("type").get("_localized").get("otherDetail")
-
-    # get all info in otherDetails:
-    description=""
-    remediation=""
-    additionalInfo=""
-    #get data from "other details section"
-    for detail in otherDetails:
-      if detail.get("key") == 'description':
-        description = detail.get("value")
-      elif detail.get("key") == 'remediation':
-        remediation = detail.get("value")
-      elif detail.get("key") == "additional-information":
-        additionalInfo = detail.get("value")
-    
-    # get data from attributes section
-    severity=""
-    cweID=""
-    methodType=""
-    locationPath=""
-    locationQuery=""
-    overallScore=""
-    scores=""
-    attackScope=""
-    attackTarget=""
-    version=""
-    attributes = issue.get("attributes")
-    for attribute in attributes:
-      if attribute.get("key") == "severity":
-        severity = attribute.get("value")
-      elif attribute.get("key") == "cwe":
-        cweID = attribute.get("value"," - ")
-        # just get ID number
-        cweID = cweID.split("-")[1]
-      elif attribute.get("key") == "method":
-        methodType = attribute.get("value") 
-      elif attribute.get("key") == "location":
-        locationPathParsed = attribute.get("value")
-        locationPathParsed = urlparse(locationPathParsed)
-        locationPath = locationPathParsed.path
-        if locationPathParsed.query != "":
-          locationQuery = locationPathParsed.query
-      elif attribute.get("key") == "evidence":
-        # just store the evidence data for now, we will dynamically write the XML later
-        evidenceData = attribute.get("value")
-      elif attribute.get("key") == "attack-scope":
-        attackScope = attribute.get("value")
-      elif attribute.get("key") == "attack-target":
-        attackTarget = attribute.get("value")
-      elif attribute.get("key") == "overall-score":
-        overallScore = attribute.get("value")
-      elif attribute.get("key") == "version":
-        version = attribute.get("value")   
-      elif attribute.get("key") == "scores":
-        scores = attribute.get("value")
-
-    # Now that we have all the data lets build the XML finding
-    finding = ET.SubElement(findings, 'finding', severity=severity, type='dynamic')
-    tool = ET.SubElement(finding, 'tool', name=toolName, category=findingCategory, code=toolCode)
-    cwe = ET.SubElement(finding, 'cwe', id=cweID)
-    nativeTool = ET.SubElement(finding, 'native-id', name=nativeToolName, value=nativeToolId)
-    descriptionXML = ET.SubElement(finding, 'description', format='html', include_in_hash='false')
-    # add additional items to description
-    if remediation != "":
-      description+="<br><br><h3>Remediation:</h3><br>"+remediation
-    if overallScore != "":
-      description+="<br><br><h3>Overall Score:</h3><br>"+str(overallScore)
-    if scores != "":
-      description+="<br><br><h3>Scores:</h3><br>"+scores
-    descriptionXML.text = description
-    location = ET.SubElement(finding, 'location', type='url', path=locationPath)
-    variants = ET.SubElement(location, 'variants')
-
-    # Loop through evidence and add variants to xml
-    for evidence in evidenceData:
-      variant_element = ET.SubElement(variants, 'variant')
-      bodyText = evidence.get("attack").get("payload","")
-      links = evidence.get("_links")
-      # loop through links here:
-      for link in links:
-        if link.get("rel") == "request":
-          # Create the request element with method, path, and query attributes
-          rr_element = ET.Element('request', method=link.get("method", ''), path=locationPath, query=locationQuery)
-          headerText = getLinkData(link.get("href"),apiKey).decode("utf-8")
-          header_element = ET.SubElement(rr_element, 'headers')
-          header_element.text = headerText
-          body_element = ET.SubElement(rr_element, 'body', truncated="false", original_length=str(len(bodyText)),length=str(len(bodyText))) 
-          body_element.text = base64.b64encode(bodyText.encode()).decode()
-          #print(body_element.text)
-          variant_element.append(rr_element)
-        elif link.get("rel") == "response":
-          # get data from polaris
-          linkText = getLinkData(link.get("href"),apiKey)
-          # Extract headers and body from text since Polaris puts it in one big blob
-          parser = BytesParser()
-          message = parser.parsebytes(linkText)
-          headers = str(message).split('\n\n',1)[0]
-          body = str(message).split('\n\n',1)[1]
-          originalBodyLength=str(len(body))
-          body= base64.b64encode(body.encode()).decode()
-          # get response code
-          resp_code = headers.split('\n')[1].split(" ")[1]
-          rr_element = ET.Element("response", code=resp_code)
-          header_element = ET.SubElement(rr_element, 'headers')
-          header_element.text = headers
-          body_element = ET.SubElement(rr_element, 'body', truncated="false", original_length=originalBodyLength,length=str(len(body)))               
-          body_element.text = body
-          variant_element.append(rr_element)
-      
-    # Parse the 'report' element instead of the 'root' element
-    dom = xml.dom.minidom.parseString(ET.tostring(report, 'utf-8'))
-    pretty_xml_as_string = dom.toprettyxml()
-    # Write XML to file
-    with open(outputFile, 'w', encoding='utf-8') as f:
-        f.write(pretty_xml_as_string)
+def createSRMXML(inputFile,outputFile,apiKey,indent=True,maxWorkers=8,maxConnectionsPerHost=8,batchSize=100,cache=None,state=None,session=None,maxBodySize=None,processes=1):
+  # Stream the issues from the json export one at a time instead of loading the whole file
+  with openArray(inputFile, "_items") as issues:
+    # Ensure the vulnerabilities data is a list
+    if not issues.found:
+        raise ValueError("No Issues Found In the Input File.")  
+    else:
+      print(f"Converting issues to SRM XML format...")
+
+    return convertIssues(issues, outputFile, apiKey, indent, maxWorkers, maxConnectionsPerHost, batchSize, cache, state, session, maxBodySize, processes)
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   parser.add_argument('--inputFileName', help='Name of the json export to be converted to SRM XML format')
   parser.add_argument('--outputFileName', default="srm-output.xml", help='Name of the SRM XML output file.')
   parser.add_argument('--polarisAPIKey', default=os.environ.get('POLARIS_API_KEY'), help='Polaris API Key, Used to retrieve request/response details.')
+  parser.add_argument('--compact', action='store_true', help='Write the SRM XML without indentation to reduce the output file size.')
+  parser.add_argument('--maxWorkers', type=int, default=int(os.environ.get('POLARIS_MAX_WORKERS', 8)), help='Maximum number of request/response details downloaded from Polaris at the same time.')
+  parser.add_argument('--maxConnectionsPerHost', type=int, default=int(os.environ.get('POLARIS_MAX_CONNECTIONS', 8)), help='Maximum number of open connections to the Polaris host.')
+  parser.add_argument('--batchSize', type=int, default=100, help='Number of issues whose request/response details are downloaded together before their findings are written.')
+  parser.add_argument('--maxBodySize', type=int, default=int(os.environ.get('POLARIS_MAX_BODY_SIZE', 0)), help='Optional, maximum size in bytes of the request/response bodies written to the SRM XML, longer bodies are cut and marked as truncated. 0 keeps the whole bodies.')
+  parser.add_argument('--processes', type=int, default=int(os.environ.get('SRM_CONVERT_PROCESSES', 1)), help='Optional, number of worker processes building the SRM XML findings, more than 1 converts large exports on several cores. The output is the same as with a single process.')
+  parser.add_argument('--cacheDir', default=os.environ.get('POLARIS_EVIDENCE_CACHE_DIR'), help='Optional, directory used to cache request/response details between runs, if not set nothing is cached.')
+  parser.add_argument('--cacheMaxMB', type=int, default=512, help='Maximum size of the request/response details cache in MB.')
+  parser.add_argument('--cacheTTLHours', type=float, default=168, help='Number of hours cached request/response details are used before they are checked with Polaris again.')
+  parser.add_argument('--stateDir', default=os.environ.get('SRM_SYNC_STATE_DIR'), help='Optional, directory used to remember the issues converted by the previous run, unchanged issues are not converted again.')
   args = parser.parse_args()
 
   if not args.inputFileName or not args.outputFileName:
@@ -180,4 +436,11 @@ if __name__ == '__main__':
     outputFile = args.outputFileName
     inputFile = args.inputFileName
     apiKey = args.polarisAPIKey
-    createSRMXML(inputFile,outputFile, apiKey)
+    cache = None
+    if args.cacheDir:
+      cache = EvidenceCache(args.cacheDir, args.cacheMaxMB * 1024 * 1024, args.cacheTTLHours * 3600)
+    state = SyncState(args.stateDir) if args.stateDir else None
+    createSRMXML(inputFile,outputFile, apiKey, indent=not args.compact, maxWorkers=args.maxWorkers, maxConnectionsPerHost=args.maxConnectionsPerHost, batchSize=args.batchSize, cache=cache, state=state, maxBodySize=args.maxBodySize, processes=args.processes)
+    # in tool orchestration mode SRM imports the output file itself, so the state is saved once the file is written
+    if state is not None:
+      state.commit()
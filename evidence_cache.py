@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+# On disk cache for the request/response evidence blobs downloaded from Polaris.
+# The cache directory contains two sub directories:
+#   refs/  - one small json file per evidence href (named by the sha256 of the href) holding the
+#            digest of the content, the ETag returned by Polaris and the time it was stored.
+#   blobs/ - the decoded evidence bytes, zlib compressed and named by the sha256 of the content, so
+#            identical evidence referenced by several hrefs is only stored once.
+# Refs older than ttl are revalidated with the ETag (or downloaded again), blobs are evicted least
+# recently used first once the cache grows past maxBytes.
+class EvidenceCache:
+
+  def __init__(self, directory, maxBytes=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+    self.directory = directory
+    self.maxBytes = maxBytes
+    self.ttl = ttl
+    self.refsDir = os.path.join(directory, "refs")
+    self.blobsDir = os.path.join(directory, "blobs")
+    os.makedirs(self.refsDir, exist_ok=True)
+    os.makedirs(self.blobsDir, exist_ok=True)
+    self.hits = 0
+    self.misses = 0
+    self.revalidated = 0
+    self.lock = threading.Lock()
+    self.evictLock = threading.Lock()
+
+  def refPath(self, href):
+    return os.path.join(self.refsDir, hashlib.sha256(href.encode("utf-8")).hexdigest() + ".json")
+
+  def blobPath(self, digest):
+    return os.path.join(self.blobsDir, digest + ".z")
+
+  def writeFile(self, path, data):
+    # write to a temporary file first so a concurrent reader never sees a partial file
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.replace(tmpPath, path)
+
+  def lookup(self, href):
+    # Returns (data, etag, fresh), data is None if the href is not cached
+    try:
+      with open(self.refPath(href), 'r', encoding='utf-8') as f:
+        ref = json.load(f)
+      blobPath = self.blobPath(ref["digest"])
+      with open(blobPath, 'rb') as f:
+        data = zlib.decompress(f.read())
+      # touch the blob so it counts as recently used for the LRU eviction
+      os.utime(blobPath)
+    except (OSError, ValueError, KeyError, zlib.error):
+      return None, None, False
+    return data, ref.get("etag"), time.time() - ref.get("stored", 0) <= self.ttl
+
+  def put(self, href, data, etag=None):
+    digest = hashlib.sha256(data).hexdigest()
+    blobPath = self.blobPath(digest)
+    try:
+      os.utime(blobPath)
+    except FileNotFoundError:
+      # not cached yet, or evicted in the meantime
+      self.writeFile(blobPath, zlib.compress(data))
+    ref = {"href": href, "digest": digest, "etag": etag, "stored": time.time()}
+    self.writeFile(self.refPath(href), json.dumps(ref).encode("utf-8"))
+
+  def refresh(self, href, data, etag=None):
+    # the server confirmed the cached content is still current (HTTP 304)
+    self.put(href, data, etag)
+    self.record("revalidated")
+
+  def record(self, outcome):
+    with self.lock:
+      if outcome == "hit":
+        self.hits += 1
+      elif outcome == "revalidated":
+        self.revalidated += 1
+      else:
+        self.misses += 1
+
+  def entries(self, directory, suffix):
+    # (path, size, mtime) of the cached files, the temporary files of writeFile (no suffix) belong to a writer still
+    # working on them and entries removed by another process in the meantime are skipped
+    entries = []
+    for entry in os.scandir(directory):
+      if not entry.name.endswith(suffix):
+        continue
+      try:
+        stat = entry.stat()
+      except FileNotFoundError:
+        continue
+      entries.append((entry.path, stat.st_size, stat.st_mtime))
+    return entries
+
+  def remove(self, path):
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+  def evict(self):
+    # several conversions can share the cache (batch mode threads, or other processes using the same directory)
+    with self.evictLock:
+      now = time.time()
+      # drop refs that expired a long time ago, they can't be revalidated cheaply anymore
+      for path, size, mtime in self.entries(self.refsDir, ".json"):
+        if now - mtime > 2 * self.ttl:
+          self.remove(path)
+
+      # then remove blobs not used within the ttl, and the least recently used blobs until we are under maxBytes
+      blobs = sorted(self.entries(self.blobsDir, ".z"), key=lambda entry: entry[2])
+      totalBytes = sum(size for path, size, mtime in blobs)
+      removed = 0
+      for path, size, mtime in blobs:
+        if totalBytes <= self.maxBytes and now - mtime <= self.ttl:
+          break
+        totalBytes -= size
+        self.remove(path)
+        removed += 1
+      return removed
+
+  def report(self):
+    print(f"Evidence cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} misses")
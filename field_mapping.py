@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Declarative mapping from the issues of a 3rd party tool to the fields used to build the SRM XML findings.
+# A connector declares once which source value goes to which field, e.g.:
+#   MAPPING = FieldMapping({
+#     "nativeToolId": Field("id"),
+#     "toolCode": Field("type.name"),
+#     "severity": Field("attributes[severity]", default="unspecified", transform=mapSeverity),
+#     "cweIDs": Field("cweId", transform=splitList(",")),
+#     "description": Description([("Remediation", "remediation")], head="summary"),
+#   })
+#   fields = MAPPING.extract(issue)
+# Sources are dotted paths into the issue ("type._localized.name"), or "list[key]" for the value of the entry whose
+# "key" is key in a list of {"key": ..., "value": ...} entries, like the attributes of a Polaris issue.
+# The mapping is compiled into closures when it is created: every list is walked once per issue and each entry is
+# dispatched with a dict lookup, so the cost per issue does not grow with the number of fields mapped from the same list.
+
+from operator import itemgetter
+
+LIST_FIELD = "["
+VALUE = "\0"
+
+class Field:
+  # default is used when the source is missing or null, transform is applied to the value (and to the default).
+  # A transform returning a tuple can fill several fields at once, e.g. ("path", "query"): Field("url", transform=split)
+  def __init__(self, source, default="", transform=None):
+    self.source = source
+    self.default = default
+    self.transform = transform
+
+class Description:
+  # Builds an html description from the head field followed by one section per (title, field) that is not empty.
+  # A section can also be given a function of the extracted fields instead of a field name, returning "" to skip it.
+  def __init__(self, sections, head="description", headFormat="{value}", sectionFormat="<br><br><h3>{title}:</h3><br>{value}"):
+    self.head = head
+    self.headFormat = headFormat.split("{value}", 1)
+    # the titles are formatted once, only the values are added per issue
+    self.sections = [(sectionFormat.format(title=title, value=VALUE).split(VALUE, 1), source) for title, source in sections]
+
+class FieldMapping:
+  # The fields are compiled into a list of steps, each one a function(issue, fields) filling some of the fields, run
+  # in order by extract(). The defaults are shared by all the issues and should not be modified.
+
+  def __init__(self, fields, entryKey="key", entryValue="value"):
+    self.fields = fields
+    self.entryKey = entryKey
+    self.entryValue = entryValue
+    self.steps = self.compile()
+
+  def extract(self, issue):
+    fields = {}
+    for step in self.steps:
+      step(issue, fields)
+    return fields
+
+  def compile(self):
+    plain = []
+    # list path -> {entry key: [setters of the fields mapped from that entry]}
+    lists = {}
+    descriptions = []
+    for name, field in self.fields.items():
+      if isinstance(field, Description):
+        descriptions.append((name, field))
+      elif LIST_FIELD in field.source:
+        path, key = field.source[:-1].split(LIST_FIELD, 1)
+        lists.setdefault(path, {}).setdefault(key, []).append(fieldSetter(name, field))
+      else:
+        plain.append((name, field))
+    steps = [plainStep(plain)] if plain else []
+    for path, dispatch in lists.items():
+      steps.append(listStep(pathGetter(path), dispatch, self.entryKey, self.entryValue))
+    for name, description in descriptions:
+      steps.append(descriptionStep(name, description))
+    return steps
+
+def pathGetter(path):
+  # function(issue) reading the dotted path, None when any part of it is missing
+  first, *keys = path.split(".")
+  if not keys:
+    return lambda issue: issue.get(first)
+  def getPath(issue):
+    value = issue.get(first)
+    for key in keys:
+      value = value.get(key) if isinstance(value, dict) else None
+    return value
+  return getPath
+
+def fieldSetter(name, field):
+  # function(fields, value) setting the field from the source value, None when it is missing
+  default = field.default
+  transform = field.transform
+  if isinstance(name, tuple):
+    def setTuple(fields, value):
+      value = default if value is None else value
+      for part, partValue in zip(name, transform(value) if transform is not None else value):
+        fields[part] = partValue
+    return setTuple
+  if transform is not None:
+    def setTransformed(fields, value):
+      fields[name] = transform(default if value is None else value)
+    return setTransformed
+  def setValue(fields, value):
+    fields[name] = default if value is None else value
+  return setValue
+
+def plainStep(plain):
+  # the fields read from a top level member without transform (most of them) are set in one loop, without a function
+  # call per field, the others through their getter and setter
+  simple = []
+  other = []
+  for name, field in plain:
+    if "." not in field.source and field.transform is None and not isinstance(name, tuple):
+      simple.append((name, field.source, field.default))
+    else:
+      other.append((pathGetter(field.source), fieldSetter(name, field)))
+  def step(issue, fields):
+    for name, source, default in simple:
+      value = issue.get(source)
+      fields[name] = default if value is None else value
+    for getValue, setField in other:
+      setField(fields, getValue(issue))
+  return step
+
+def listStep(getList, dispatch, entryKey, entryValue):
+  # every entry of the list costs a single dict lookup whatever the number of mapped keys, the last one wins
+  def step(issue, fields):
+    found = {}
+    for entry in getList(issue) or ():
+      key = entry.get(entryKey)
+      if key in dispatch:
+        found[key] = entry.get(entryValue)
+    for key, setters in dispatch.items():
+      value = found.get(key)
+      for setField in setters:
+        setField(fields, value)
+  return step
+
+def descriptionStep(name, description):
+  headBefore, headAfter = description.headFormat
+  head = description.head
+  # a section given as a field name reads that field
+  sections = [(before, after, source if callable(source) else itemgetter(source)) for (before, after), source in description.sections]
+  def step(issue, fields):
+    text = headBefore + str(fields[head]) + headAfter
+    for before, after, section in sections:
+      value = section(fields)
+      if value != "":
+        text += before + str(value) + after
+    fields[name] = text
+  return step
+
+# Transforms shared by the connectors
+
+def splitList(separator):
+  return lambda value: value.split(separator)
+
+def pluck(key, default=""):
+  # the key of every object in a list
+  return lambda values: [value.get(key, default) for value in values]
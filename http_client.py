@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+
+# Shared request layer for the Polaris and SRM API calls. A single 429 or 503 during a big import should not throw
+# away the work done so far, so every call goes through sendWithRetry:
+#   - a 429, or any answer with a Retry-After header, is retried after the time the server asked for
+#   - idempotent calls (GET, PUT, ...) are also retried on 5xx answers and connection errors, with jittered exponential backoff
+#   - other calls (POST) are only retried when the server said it did not process them (429 / Retry-After)
+# When a limiter is given, throttling answers (429/503) halve the number of calls allowed in flight and every
+# successful call raises it again slowly (AIMD), which keeps the throughput close to the server's limit.
+# Once the retries are used up the last response is returned, so the callers handle it as before.
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+class AdaptiveLimiter:
+
+  def __init__(self, limit=8, minLimit=1, cooldown=1.0):
+    self.maxLimit = limit
+    self.minLimit = minLimit
+    self.limit = float(limit)
+    # several calls usually get throttled together, they only count as one signal within the cooldown
+    self.cooldown = cooldown
+    self.lastDecrease = 0.0
+    self.inFlight = 0
+    self.condition = threading.Condition()
+
+  def __enter__(self):
+    with self.condition:
+      while self.inFlight >= int(self.limit):
+        self.condition.wait()
+      self.inFlight += 1
+    return self
+
+  def __exit__(self, *args):
+    with self.condition:
+      self.inFlight -= 1
+      self.condition.notify()
+
+  def onSuccess(self):
+    # additive increase, about one more call in flight per limit successful calls
+    with self.condition:
+      if self.limit < self.maxLimit:
+        self.limit = min(self.maxLimit, self.limit + 1 / self.limit)
+        self.condition.notify_all()
+
+  def onThrottle(self):
+    # multiplicative decrease
+    with self.condition:
+      now = time.monotonic()
+      if now - self.lastDecrease >= self.cooldown:
+        self.lastDecrease = now
+        self.limit = max(self.minLimit, self.limit / 2)
+        print(f"Server is throttling, lowering the concurrent requests to {int(self.limit)}")
+
+def retryAfter(response, maxDelay):
+  # Retry-After is either a number of seconds or an http date
+  value = response.headers.get("Retry-After") if response is not None else None
+  if not value:
+    return None
+  try:
+    delay = float(value)
+  except ValueError:
+    try:
+      delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+      return None
+  return min(maxDelay, max(0.0, delay))
+
+def sendWithRetry(send, method, url, retries=5, backoff=0.5, maxBackoff=30, limiter=None, idempotent=None):
+  # send is called for every attempt and returns a response, e.g. a lambda creating a fresh upload body each time
+  if idempotent is None:
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+  attempt = 0
+  while True:
+    try:
+      if limiter is not None:
+        with limiter:
+          response = send()
+      else:
+        response = send()
+    except (requests.ConnectionError, requests.Timeout) as e:
+      if not idempotent or attempt >= retries:
+        raise
+      delay = random.uniform(0, min(maxBackoff, backoff * 2 ** attempt))
+      print(f"WARNING: {method} {url} failed with {type(e).__name__}, retrying in {delay:.1f}s...")
+    else:
+      status = response.status_code
+      if status in THROTTLE_STATUSES and limiter is not None:
+        limiter.onThrottle()
+      elif status < 400 and limiter is not None:
+        limiter.onSuccess()
+      delay = retryAfter(response, maxBackoff * 4)
+      retryable = status == 429 or delay is not None or (idempotent and status in RETRY_STATUSES)
+      if status not in RETRY_STATUSES or not retryable or attempt >= retries:
+        return response
+      if delay is None:
+        delay = random.uniform(0, min(maxBackoff, backoff * 2 ** attempt))
+      print(f"WARNING: {method} {url} answered {status}, retrying in {delay:.1f}s...")
+      response.close()
+    time.sleep(delay)
+    attempt += 1
+
+class RetryingSession(requests.Session):
+  # drop in replacement for requests.Session, every call made through it goes through sendWithRetry.
+  # Pass idempotent=True to retry a POST that only reads, e.g. a query.
+  def __init__(self, retries=5, backoff=0.5, maxBackoff=30, limiter=None):
+    super().__init__()
+    self.retries = retries
+    self.backoff = backoff
+    self.maxBackoff = maxBackoff
+    self.limiter = limiter
+
+  def request(self, method, url, *args, idempotent=None, **kwargs):
+    send = lambda: self.requestOnce(method, url, *args, **kwargs)
+    return sendWithRetry(send, method, url, self.retries, self.backoff, self.maxBackoff, self.limiter, idempotent)
+
+  def requestOnce(self, method, url, *args, **kwargs):
+    # a single attempt, for callers driving sendWithRetry themselves, e.g. to create a fresh upload body per attempt
+    return super().request(method, url, *args, **kwargs)
+
+# Module level calls without a session, so (session or http_client).get(...) works like (session or requests).get(...)
+def request(method, url, idempotent=None, **kwargs):
+  return sendWithRetry(lambda: requests.request(method, url, **kwargs), method, url, idempotent=idempotent)
+
+def get(url, **kwargs):
+  return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+  return request('POST', url, **kwargs)
+
+def put(url, **kwargs):
+  return request('PUT', url, **kwargs)
@@ -2,21 +2,99 @@
 
 import argparse
 import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pull_dast_results
 import convert_dast_results
+import pull_and_convert_dast_results
 import srmPost
+import srm_client
+from evidence_cache import EvidenceCache
+from sync_state import SyncState
+from lookup_cache import LookupCache
+from project_manifest import loadManifest
+import run_metrics
 
-def main(sourceProjectName, sourceURL, sourceAPIKey, srmProjectName, srmURL, srmAPIKey):
-  # first pull the results
-  exportFile = "sourceExport.json"
-  pull_dast_results.main(sourceURL, sourceProjectName, exportFile, sourceAPIKey)
+def projectKey(sourceProjectName, srmProjectName):
+  # file system safe name for a source/destination project pair
+  return re.sub(r'[^A-Za-z0-9_.-]', '_', f"{sourceProjectName}-{srmProjectName}")
 
-  # Second, convert the data to SRM XML Format
-  importFile = "sourceSRMXML.xml"
-  convert_dast_results.createSRMXML(exportFile, importFile, sourceAPIKey)
+def main(sourceProjectName, sourceURL, sourceAPIKey, srmProjectName, srmURL, srmAPIKey, evidenceCacheDir=None, stateDir=None, workDir=".", polarisSession=None, portfolioID=None, idCache=None, zipUpload=False, keepExport=False, tracker=None, maxBodySize=None, processes=1, cache=None):
+  # if a state directory is configured, unchanged issues since the last successful import of this project pair are not converted again
+  state = SyncState(os.path.join(stateDir, projectKey(sourceProjectName, srmProjectName))) if stateDir else None
+  # reuse request/response details downloaded by previous runs if a cache directory is configured
+  if cache is None and evidenceCacheDir:
+    cache = EvidenceCache(evidenceCacheDir)
 
-  # Finally, push the results to SRM
-  srmPost.main(srmAPIKey, srmURL, srmProjectName, importFile)
+  # Pull the results and convert them to SRM XML format as they arrive, the json export is only kept on request
+  exportFile = os.path.join(workDir, "sourceExport.json") if keepExport else None
+  importFile = os.path.join(workDir, "sourceSRMXML.xml")
+  pull_and_convert_dast_results.main(sourceURL, sourceProjectName, sourceAPIKey, importFile, exportFile, cache=cache, state=state, session=polarisSession, portfolioID=portfolioID, idCache=idCache, maxBodySize=maxBodySize, processes=processes)
+
+  if state is not None and state.isUnchanged():
+    print(f"No issues changed since the last import of {sourceProjectName}, skipping the upload to SRM.")
+    return True
+
+  # Finally, push the results to SRM, the state is only saved once SRM accepted the results.
+  # With a tracker the analysis job SRM started is added to it, to wait for it later.
+  uploaded = srmPost.main(srmAPIKey, srmURL, srmProjectName, importFile, compress=zipUpload, tracker=tracker)
+  if uploaded and state is not None:
+    state.commit()
+  return bool(uploaded)
+
+def analysisSummary(jobs):
+  # label (srm project name) -> text describing how its analysis ended
+  return {job['label']: f"analysis {job['status']}" + (f" after {job['seconds']:.1f}s" if job['seconds'] is not None else "") for job in jobs.values()}
+
+def runBatch(manifestFile, sourceURL, sourceAPIKey, srmURL, srmAPIKey, workers=4, evidenceCacheDir=None, stateDir=None, workDir=".", idCache=None, zipUpload=False, keepExport=False, waitForAnalysis=False, analysisTimeout=None, maxBodySize=None, processes=1):
+  projects = loadManifest(manifestFile)
+  print(f"Importing {len(projects)} projects with {workers} workers...")
+  # the next project is imported while SRM is still analyzing the previous ones, their jobs are only waited for at the end
+  tracker = srmPost.JobTracker(srmURL, {'Authorization': 'Bearer ' + srmAPIKey}) if waitForAnalysis else None
+
+  # one pooled polaris session, portfolio lookup and evidence cache shared by every project in the batch
+  polarisSession = convert_dast_results.createSession(workers * 8)
+  cache = EvidenceCache(evidenceCacheDir) if evidenceCacheDir else None
+  portfolioID = pull_dast_results.getCachedPortfolioId(sourceURL, {'Api-token': sourceAPIKey}, polarisSession, idCache)
+
+  def importProject(project):
+    sourceProjectName, srmProjectName = project
+    projectDir = os.path.join(workDir, projectKey(sourceProjectName, srmProjectName))
+    os.makedirs(projectDir, exist_ok=True)
+    start = time.perf_counter()
+    error = None
+    try:
+      if not main(sourceProjectName, sourceURL, sourceAPIKey, srmProjectName, srmURL, srmAPIKey, evidenceCacheDir, stateDir, projectDir, polarisSession, portfolioID, idCache, zipUpload, keepExport, tracker, maxBodySize, processes, cache):
+        error = "SRM did not accept the results"
+    except (Exception, SystemExit) as e:
+      # one failing project should not abort the rest of the batch
+      error = f"{type(e).__name__}: {e}"
+    return sourceProjectName, srmProjectName, time.perf_counter() - start, error
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    results = list(executor.map(importProject, projects))
+  polarisSession.close()
+
+  analyses = {}
+  if tracker is not None:
+    print("Waiting for SRM to finish the analyses...")
+    analyses = analysisSummary(tracker.wait(analysisTimeout))
+
+  print("Batch import summary:")
+  failed = 0
+  for sourceProjectName, srmProjectName, elapsed, error in results:
+    analysis = analyses.get(srmProjectName)
+    if error is None and analysis is not None and not analysis.startswith("analysis completed"):
+      error = analysis
+    if error is None:
+      print(f"  OK     {sourceProjectName} -> {srmProjectName} ({elapsed:.1f}s)" + (f", {analysis}" if analysis else ""))
+    else:
+      failed += 1
+      print(f"  FAILED {sourceProjectName} -> {srmProjectName} ({elapsed:.1f}s): {error}")
+  print(f"{len(results) - failed} of {len(results)} projects imported successfully.")
+  return failed
 
 
 if __name__ == '__main__':
@@ -27,13 +105,56 @@ if __name__ == '__main__':
   parser.add_argument('--srmProjectName', help='Name of the existing, or to be created SRM project name.')
   parser.add_argument('--srmURL', default=os.environ.get('SRM_URL'), help='SRM URL to import the results to.')
   parser.add_argument('--srmAPIKey', default=os.environ.get('SRM_API_KEY'), help='SRM API Key')
+  parser.add_argument('--evidenceCacheDir', default=os.environ.get('POLARIS_EVIDENCE_CACHE_DIR'), help='Optional, directory used to cache request/response details from the source system between runs.')
+  parser.add_argument('--stateDir', default=os.environ.get('SRM_SYNC_STATE_DIR'), help='Optional, directory used to remember the last successful import, unchanged issues are not converted again and the upload is skipped when nothing changed.')
+  parser.add_argument('--manifest', help='Optional, json or toml file listing several source/SRM project pairs to import in one run, replaces --sourceProjectName and --srmProjectName.')
+  parser.add_argument('--workers', type=int, default=4, help='Number of projects imported at the same time in batch (--manifest) mode.')
+  parser.add_argument('--workDir', default=".", help='Directory used for the intermediate export and SRM XML files.')
+  parser.add_argument('--idCacheFile', default=os.environ.get('POLARIS_ID_CACHE_FILE'), help='Optional, file used to cache the polaris portfolio ids of the projects between runs.')
+  parser.add_argument('--idCacheTTLHours', type=float, default=24, help='Number of hours cached polaris portfolio ids are used before they are looked up again.')
+  parser.add_argument('--keepExport', action='store_true', help='Optional, also write the issues pulled from the source system to sourceExport.json in --workDir, e.g. for debugging the conversion.')
+  parser.add_argument('--zipUpload', action='store_true', default=os.environ.get('SRM_UPLOAD_ZIP', '').lower() in ('1', 'true', 'yes'), help='Optional, compress the SRM XML into a zip archive before uploading it to SRM.')
+  parser.add_argument('--processes', type=int, default=int(os.environ.get('SRM_CONVERT_PROCESSES', 1)), help='Optional, number of worker processes building the SRM XML findings, more than 1 converts large exports on several cores. The output is the same as with a single process.')
+  parser.add_argument('--maxBodySize', type=int, default=int(os.environ.get('POLARIS_MAX_BODY_SIZE', 0)), help='Optional, maximum size in bytes of the request/response bodies written to the SRM XML, longer bodies are cut and marked as truncated. 0 keeps the whole bodies.')
+  parser.add_argument('--waitForAnalysis', action='store_true', help='Optional, wait for SRM to finish analyzing the uploaded results and report how each analysis ended. In batch (--manifest) mode the analyses are only waited for once every project is uploaded.')
+  parser.add_argument('--analysisTimeout', type=float, default=None, help='Optional, with --waitForAnalysis the maximum number of seconds to wait for the analyses.')
+  parser.add_argument('--metrics', action='store_true', default=os.environ.get('SRM_RUN_METRICS', '').lower() in ('1', 'true', 'yes'), help='Optional, write the time spent per stage, the HTTP calls per endpoint and the peak memory of the run to a <result file>-metrics.json report in --workDir (one report for the whole batch in --manifest mode).')
+  parser.add_argument('--prometheus', action='store_true', default=os.environ.get('SRM_RUN_METRICS_PROMETHEUS', '').lower() in ('1', 'true', 'yes'), help='Optional, with --metrics also write the report as a <result file>-metrics.prom Prometheus textfile.')
 
   args = parser.parse_args()
+  idCache = LookupCache(args.idCacheFile, args.idCacheTTLHours * 3600) if args.idCacheFile else None
+  if args.metrics:
+    run_metrics.start()
 
-  if not args.sourceProjectName or not args.sourceURL or not args.sourceAPIKey or not args.srmURL or not args.srmAPIKey:
+  if args.manifest and args.sourceURL and args.sourceAPIKey and args.srmURL and args.srmAPIKey:
+    try:
+      failed = runBatch(args.manifest, args.sourceURL, args.sourceAPIKey, args.srmURL, args.srmAPIKey, args.workers, args.evidenceCacheDir, args.stateDir, args.workDir, idCache, args.zipUpload, args.keepExport, args.waitForAnalysis, args.analysisTimeout, args.maxBodySize, args.processes)
+    finally:
+      srm_client.closeClients()
+      if args.metrics:
+        run_metrics.stop().write(os.path.join(args.workDir, "batch"), args.prometheus)
+    sys.exit(1 if failed else 0)
+  elif not args.sourceProjectName or not args.sourceURL or not args.sourceAPIKey or not args.srmURL or not args.srmAPIKey:
     parser.print_help()
   else:
     if args.srmProjectName is None:
       args.srmProjectName = args.sourceProjectName
       
-    main(args.sourceProjectName, args.sourceURL, args.sourceAPIKey, args.srmProjectName, args.srmURL, args.srmAPIKey)
+    tracker = srmPost.JobTracker(args.srmURL, {'Authorization': 'Bearer ' + args.srmAPIKey}) if args.waitForAnalysis else None
+    failed = False
+    try:
+      if not main(args.sourceProjectName, args.sourceURL, args.sourceAPIKey, args.srmProjectName, args.srmURL, args.srmAPIKey, args.evidenceCacheDir, args.stateDir, args.workDir, idCache=idCache, zipUpload=args.zipUpload, keepExport=args.keepExport, tracker=tracker, maxBodySize=args.maxBodySize, processes=args.processes):
+        print(f"ERROR: SRM did not accept the results of {args.sourceProjectName}")
+        failed = True
+      elif tracker is not None:
+        # same outcome as a project of the batch summary, the import fails if its analysis did not complete
+        for srmProjectName, analysis in analysisSummary(tracker.wait(args.analysisTimeout)).items():
+          print(f"{srmProjectName}: {analysis}")
+          if not analysis.startswith("analysis completed"):
+            failed = True
+    finally:
+      # close the pooled SRM connections, the report is written for failed runs as well, they are the ones worth looking at
+      srm_client.closeClients()
+      if args.metrics:
+        run_metrics.stop().write(os.path.join(args.workDir, "sourceSRMXML.xml"), args.prometheus)
+    sys.exit(1 if failed else 0)
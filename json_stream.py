@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import json
+
+# what can follow a complete number, anything else (or the end of the buffer) means it may continue in the next chunk
+NUMBER_END = frozenset(',]} \t\n\r')
+
+# Iterates over the items of one array member of a top level json object without loading the whole document, e.g.
+# for an export like {"metadata": {...}, "findings": [{...}, {...}]}:
+#   with JSONArrayStream("export.json", "findings") as stream:
+#     stream.metadata         -> {"metadata": {...}}, the members stored before the array
+#     for finding in stream:  -> one decoded finding at a time
+# Only the item being decoded and the read buffer are held in memory. Members stored after the array are added to
+# metadata once all the items have been read, openArray() can be used to have them before the items are streamed.
+class JSONArrayStream:
+
+  def __init__(self, path, arrayKey, chunkSize=1024 * 1024):
+    self.path = path
+    self.arrayKey = arrayKey
+    self.chunkSize = chunkSize
+    self.decoder = json.JSONDecoder()
+    self.metadata = {}
+    self.found = False
+    self.consumed = False
+    self.buffer = ''
+    self.pos = 0
+    self.eof = False
+    self.file = open(path, 'r', encoding='utf-8')
+    self.expect('{')
+    if self.nextChar() == '}':
+      self.pos += 1
+      self.close()
+    else:
+      self.readMembers()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+
+  def fill(self):
+    # read more of the file, at least as much as is still pending so a large item only needs a few retries
+    data = self.file.read(max(self.chunkSize, len(self.buffer) - self.pos)) if self.file is not None else ''
+    self.buffer = self.buffer[self.pos:] + data
+    self.pos = 0
+    if not data:
+      self.eof = True
+
+  def nextChar(self):
+    # skip whitespace and return the next character without consuming it, '' at the end of the file
+    while True:
+      while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+        self.pos += 1
+      if self.pos < len(self.buffer) or self.eof:
+        return self.buffer[self.pos:self.pos + 1]
+      self.fill()
+
+  def expect(self, chars):
+    char = self.nextChar()
+    if char == '' or char not in chars:
+      raise ValueError(f"Invalid json in {self.path}, expected one of {chars!r} but found {char!r}")
+    self.pos += 1
+    return char
+
+  def decodeValue(self):
+    self.nextChar()
+    while True:
+      try:
+        value, end = self.decoder.raw_decode(self.buffer, self.pos)
+      except json.JSONDecodeError:
+        # the value does not fit in the buffer yet
+        if self.eof:
+          raise
+        self.fill()
+        continue
+      # a number could continue in the next chunk (raw_decode reads 0 out of "0." or "0.5e"), so only trust one
+      # followed by a delimiter
+      if isinstance(value, (int, float)) and not self.eof and (end == len(self.buffer) or self.buffer[end] not in NUMBER_END):
+        self.fill()
+        continue
+      self.pos = end
+      return value
+
+  def readMembers(self):
+    # read the members of the top level object up to the start of the array (or the end of the object)
+    while True:
+      key = self.decodeValue()
+      if not isinstance(key, str):
+        raise ValueError(f"Invalid json in {self.path}, expected a member name but found {key!r}")
+      self.expect(':')
+      if key == self.arrayKey and not self.found:
+        if self.nextChar() != '[':
+          raise ValueError(f"{self.arrayKey} is not a list in {self.path}")
+        self.pos += 1
+        self.found = True
+        return
+      self.metadata[key] = self.decodeValue()
+      if self.expect(',}') == '}':
+        self.close()
+        return
+
+  def __iter__(self):
+    if not self.found or self.consumed:
+      return
+    self.consumed = True
+    if self.nextChar() == ']':
+      self.pos += 1
+    else:
+      while True:
+        yield self.decodeValue()
+        if self.expect(',]') == ']':
+          break
+    # the members after the array
+    if self.expect(',}') == ',':
+      self.readMembers()
+    else:
+      self.close()
+
+def openArray(path, arrayKey, requiredKeys=()):
+  # Returns a JSONArrayStream whose metadata contains the requiredKeys before the items are streamed. If some of them
+  # are only stored after the array, a first pass reads through the items (one at a time) to get them.
+  stream = JSONArrayStream(path, arrayKey)
+  if stream.found and any(key not in stream.metadata for key in requiredKeys):
+    with JSONArrayStream(path, arrayKey) as firstPass:
+      for item in firstPass:
+        pass
+      stream.metadata = firstPass.metadata
+  return stream
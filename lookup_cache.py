@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Small persistent key -> value cache stored in a single json file, used for lookups that almost never change
+# (e.g. project name -> ids). Entries older than ttl seconds are ignored and the file is rewritten on every update,
+# so a cache shared by several threads or successive runs always sees the latest entries.
+class LookupCache:
+
+  def __init__(self, path, ttl=24 * 3600):
+    self.path = path
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.entries = {}
+    try:
+      with open(path, 'r', encoding='utf-8') as f:
+        self.entries = json.load(f)
+    except (OSError, ValueError):
+      pass
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+    if entry is None or time.time() - entry.get("stored", 0) > self.ttl:
+      return None
+    return entry.get("value")
+
+  def set(self, key, value):
+    with self.lock:
+      self.entries[key] = {"value": value, "stored": time.time()}
+      self.save()
+
+  def invalidate(self, key):
+    with self.lock:
+      if self.entries.pop(key, None) is not None:
+        self.save()
+
+  def save(self):
+    directory = os.path.dirname(os.path.abspath(self.path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmpPath = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      json.dump(self.entries, f)
+    os.replace(tmpPath, self.path)
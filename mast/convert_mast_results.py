@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
-from datetime import datetime
-import json
 import os
+import sys
 import argparse
-import pprint
+from itertools import islice
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
+# setting path so we can include the SRM XML writer from the parent directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from srm_xml_writer import SRMXMLWriter
+from json_stream import openArray
+from field_mapping import Field, FieldMapping, Description, splitList, pluck
+import parallel_convert
 
 def mapSeverity(nativeSeverity):
   nativeSeverity = nativeSeverity.lower()
@@ -21,187 +25,228 @@ def add_string(list, value):
     if value not in list:
         list.append(value)
 
-def createSRMXML(inputFile,outputFile):
-  # Load JSON data
-  with open(inputFile, 'r', encoding='utf-8') as f:
-    json_data = json.load(f)
-  
+def pciInfo(fields):
+  info = ""
+  if fields["pciDetails"] != "":
+    info+="PCI Details:"+fields["pciDetails"] +"<br>"
+  if fields["pciId"] != "":
+    info+="PCI ID: "+fields["pciId"]+"<br>"
+  if fields["pciDesc"] != "":
+    info+="PCI Description: "+fields["pciDesc"]+"<br>"
+  return info
+
+def riskInfo(fields):
+  riskObject = fields["risk"]
+  return "Impact: "+riskObject.get("impact","N/A")+"<br>Likelihood: "+riskObject.get("likelihood","N/A")+"<br>Classification: "+riskObject.get("classification","N/A")+"<br>Type: "+riskObject.get("type","N/A")+"<br>Severity: "+riskObject.get("severity","N/A")+"<br>Priority: "+str(riskObject.get("priority","N/A"))
+
+# Where the SRM finding fields come from in a TORT finding
+MAPPING = FieldMapping({
+  "nativeToolId": Field("identifier", transform=str),
+  "toolCode": Field("name"),
+  # QUESTION: these results don't really associate a "name" or "finding type" so for now I'm using the risk type
+  "nativeToolName": Field("risk.type"),
+  # get severity from risk section, if unpopulated return "unspecified"
+  "severity": Field("risk.severity", default="unspecified", transform=mapSeverity),
+  # TORT results can sometimes contain multiple cwe's in a single issue
+  "cweList": Field("cweId", transform=splitList(",")),
+  # we should probably use methodType for this:
+  "methodType": Field("foundBy"),
+  # Will be used if populated for location
+  "fixLocation": Field("fixLocation"),
+  # just store the instance data for now, we will map this to "evidence" in SRM and dynamically write the XML later
+  # I need more info here since all the instance data in my example are blank.
+  "urls": Field("instances", default=[], transform=pluck("url")),
+  "description": Field("description"),
+  "remediation": Field("remediation"),
+  "stepsToReproduce": Field("stepsToReproduce"),
+  "notes": Field("note"),
+  "likelihoodDescription": Field("likelihoodDescription"),
+  "impactDescription": Field("impactDescription"),
+  "pciDetails": Field("pciDetails"),
+  "pciId": Field("pciId", transform=lambda pciId: "" if pciId == "N/A" else pciId),
+  "pciDesc": Field("pciDesc"),
+  "risk": Field("risk", default={}),
+  # add additional items to description
+  "descriptionHTML": Description([
+    ("Remediation", "remediation"),
+    ("Steps to Reproduce", "stepsToReproduce"),
+    ("Notes", "notes"),
+    ("Likelihood", "likelihoodDescription"),
+    ("PCI Info", pciInfo),
+    ("Impact Description", "impactDescription"),
+    ("Risk", riskInfo)
+  ], headFormat="<h3>Description:</h3>{value}", sectionFormat="<br><br><h3>{title}:</h3>{value}")
+})
+
+def createFinding(issue, toolName, packageName, detection_methods):
+  # Get all top level info:
+  # QUESTION: Just set finding category to "Security"
+  findingCategory="Security" 
+  fields = MAPPING.extract(issue)
+  cweList = fields["cweList"]
+  methodType = fields["methodType"]
+  # add detection method to list:
+  if methodType != "":
+    add_string(detection_methods, methodType)
+
+  # Now that we have all the data lets build the XML finding, child elements are added in the order srm_input.xsd expects
+  finding = ET.Element('finding', severity=fields["severity"], type=methodType)
+  nativeIDKey=toolName.upper()+" Finding ID"
+  nativeTool = ET.SubElement(finding, 'native-id', name=nativeIDKey, value=fields["nativeToolId"])
+
+  # srm_input.xsd only allows a single cwe element, the full list is kept in the finding metadata below
+  if cweList[0].strip() != "":
+    cwe = ET.SubElement(finding, 'cwe', id=cweList[0].strip())
+
+  tool = ET.SubElement(finding, 'tool', name=toolName, category=findingCategory, code=fields["toolCode"])
+
+  pathToIssue=""
+  issueType="file"
+
+  if fields["fixLocation"] == "":
+    pathToIssue = packageName
+  else:
+    pathToIssue = fields["fixLocation"]
+
+  # if pathToIssue is still blank, then we need to look at the URLs extracted from above
+  if pathToIssue == "":
+    for url in fields["urls"]:
+      pathToIssue += url +"," 
+    # trim last ,
+    pathToIssue = pathToIssue[:-1]
+
+  if "https" in pathToIssue:
+    issueType="url"
+    
+
+  location = ET.SubElement(finding, 'location', type=issueType, path=pathToIssue)
+  descriptionXML = ET.SubElement(finding, 'description', {'format': 'html', 'include-in-hash': 'false'})
+  descriptionXML.text = fields["descriptionHTML"]
+  if len(cweList) > 1:
+    metadata = ET.SubElement(finding, 'metadata')
+    cweMetadata = ET.SubElement(metadata, 'value', key='CWE IDs')
+    cweMetadata.text = ",".join(cw.strip() for cw in cweList)
+  # variants = ET.SubElement(location, 'variants')
+
+  # # Loop through instances and add variants to xml
+  # I need more info here since all the instance data in my example are blank.    
+  # for evidence in instances:
+  #   variant_element = ET.SubElement(variants, 'variant')
+  #   bodyText = "N/A"
+  #   links = evidence.get("_links")
+
+  return finding
+
+def buildFragments(issues, toolName, packageName, indent):
+  # Runs in the worker processes of the parallel conversion, returns the serialized findings in the order of the
+  # issues and the detection methods in the order they were found
   detection_methods = []
+  writer = SRMXMLWriter(None, None, None, indent)
+  fragments = [writer.serializeFinding(createFinding(issue, toolName, packageName, detection_methods)) for issue in issues]
+  return fragments, detection_methods
+
+def openResults(inputFile):
+  # Stream the findings from the json export one at a time, the top level members (generatedBy, metadata) are read first
+  issues = openArray(inputFile, "findings", requiredKeys=("metadata",))
+  json_data = issues.metadata
+  metadata = json_data.get("metadata")
+
   # Tool name used for the findings to be imported into SRM
   toolName=json_data.get("generatedBy","tort")
   # Using end date of the json output for test date
-  testDate = json_data.get("metadata").get("endDate")
-  # Not currently used
-  testType = json_data.get("metadata").get("testType")
-  # Not currently used
-  versionNumber=json_data.get("metadata").get("versionNumber")
-  # Not currently used
-  applicationType=json_data.get("metadata").get("applicationType")
+  testDate = metadata.get("endDate")
+  # Not currently used: testType, versionNumber, applicationType
   # Currently used for finding location, if fixLocation is blank
-  packageName=json_data.get("metadata").get("packageName")
-  
-  #Load individual issues from the json output.
-  issues = json_data.get("findings")
+  packageName=metadata.get("packageName")
 
   # Ensure the vulnerabilities data is a list, throw error if no findings are found
-  if not isinstance(issues, list):
-      raise ValueError("Issues Found In the Input File.")  
-  else:
-    print(f"Converting issues to SRM XML format...")
-
-  # Create a new root element 'report' with 'date' and 'tool' attributes
-  report = ET.Element('report', date=testDate, tool=toolName)
-  findings = ET.SubElement(report, 'findings')
-
-  # Loop through issues and populate the SRM findings field
-  for issue in issues:
-    # Get all top level info:
-    # QUESTION: Just set finding category to "Security"
-    findingCategory="Security" 
-    nativeToolId=str(issue.get("identifier","")) #
-    toolCode=issue.get("name","") #
-    notes = issue.get("note","")
-
-    # QUESTION: these results don't really associate a "name" or "finding type" so for now I'm using the risk type
-    nativeToolName=issue.get("risk",[]).get("type","")
-    description=issue.get("description", "") #
-    remediation=issue.get("remediation", "") #
-    stepsToReproduce=issue.get("stepsToReproduce", "")
-    
-    # we should probably use methodType for this:
-    foundByMethod = issue.get("foundBy")
-    
-    # get severity from risk section, if unpopulated return "unspecified"
-    severity=mapSeverity(issue.get("risk").get("severity", "unspecified"))
-
-    cweID=issue.get("cweId","")
-    # TORT results can sometimes contain multiple cwe's in a single issue
-    cweList= cweID.split(",")
-    methodType=issue.get("foundBy","")
-    # add detection method to list:
-    if methodType != "":
-      add_string(detection_methods, methodType)
-
-    # Will be used if populated for location
-    fixLocation=issue.get("fixLocation","")
-    # Not currently used
-    systemic=issue.get("systemic","")
-    likelihoodDescription=issue.get("likelihoodDescription","")
-    impactDescription=issue.get("impactDescription","")
-    pciInfo = False
-    pciDetails=issue.get("pciDetails","")
-    pciId=issue.get("pciId","")
-    pciDesc=issue.get("pciDesc","")
-    if pciId == "N/A":
-      pciId = ""
-    if pciDetails != "" or pciId != "" or pciDesc != "":
-      pciInfo = True
-    
-    riskObject=issue.get("risk",[])
-
-    # These are not currently used
-    flawCount=issue.get("flawCount","")
-    cweIdFlawName=issue.get("cweIdFlawName","")
-    cweIdCategory=issue.get("cweIdCategory","")
-    owasp16CODE=issue.get("owasp16CODE","")
-    cvdId=issue.get("cvdId","")
-    itrc=issue.get("itrc","")
-    appscanTitle=issue.get("appscanTitle","")
-    status=issue.get("status","")
-    retestScope=issue.get("retestScope","")
-    isUpdated=issue.get("isUpdated","")
-
-
-    # just store the instance data for now, we will map this to "evidence" in SRM and dynamically write the XML later
-    # I need more info here since all the instance data in my example are blank.
-    instances = issue.get("instances",[])   
-    urls = []
-    for instance in instances:
-      urls.append(instance.get("url",""))
-  
-
-
+  if not issues.found:
+    issues.close()
+    raise ValueError(f"No Issues Found In the Input File: {inputFile}")
+  return issues, toolName, testDate, packageName, metadata
 
-    # Now that we have all the data lets build the XML finding
-    finding = ET.SubElement(findings, 'finding', severity=severity, type=methodType)
-    tool = ET.SubElement(finding, 'tool', name=toolName, category=findingCategory, code=toolCode)
-    
+def createSRMXML(inputFile,outputFile,indent=True,processes=1,chunkSize=500):
+  issues, toolName, testDate, packageName, metadata = openResults(inputFile)
+  detection_methods = []
+  print(f"Converting issues to SRM XML format...")
 
-    for cw in cweList:
-      cwe = ET.SubElement(finding, 'cwe', id=cw)
-    
-    nativeIDKey=toolName.upper()+" Finding ID"
-    nativeTool = ET.SubElement(finding, 'native-id', name=nativeIDKey, value=nativeToolId)
-    descriptionXML = ET.SubElement(finding, 'description', format='html', include_in_hash='false')
-    # add additional items to description
-    description = "<h3>Description:</h3>"+description
-    if remediation != "":
-      description+="<br><br><h3>Remediation:</h3>"+remediation
-    if stepsToReproduce != "":
-      description+="<br><br><h3>Steps to Reproduce:</h3>"+str(stepsToReproduce)
-    if notes != "":
-      description+="<br><br><h3>Notes:</h3>"+notes      
-    if likelihoodDescription != "":
-      description+="<br><br><h3>Likelihood:</h3>"+likelihoodDescription
-    if pciInfo != False:
-      description+="<br><br><h3>PCI Info:</h3>"
-      if pciDetails != "":
-        description+="PCI Details:"+pciDetails +"<br>"
-      if pciId != "":
-        description+="PCI ID: "+pciId+"<br>"
-      if pciDesc != "":
-        description+="PCI Description: "+pciDesc+"<br>"
-    if impactDescription != "":
-      description+="<br><br><h3>Impact Description:</h3>"+impactDescription        
-    if riskObject is not None:
-        description+="<br><br><h3>Risk:</h3>Impact: "+riskObject.get("impact","N/A")+"<br>Likelihood: "+riskObject.get("likelihood","N/A")+"<br>Classification: "+riskObject.get("classification","N/A")+"<br>Type: "+riskObject.get("type","N/A")+"<br>Severity: "+riskObject.get("severity","N/A")+"<br>Priority: "+str(riskObject.get("priority","N/A"))
-
-
-    descriptionXML.text = description
-    pathToIssue=""
-    issueType="file"
-
-    if fixLocation == "":
-      pathToIssue = packageName
+  # Open the report with 'date' and 'tool' attributes, each finding is streamed to the file as soon as it is built
+  with issues, SRMXMLWriter(outputFile, date=testDate, tool=toolName, indent=indent) as writer:
+    if processes > 1:
+      # chunks of findings are built in worker processes and written in the order of the input
+      def tasks():
+        findings = iter(issues)
+        while True:
+          chunk = list(islice(findings, chunkSize))
+          if not chunk:
+            break
+          yield None, (chunk, toolName, packageName, indent)
+      for key, (fragments, methods) in parallel_convert.mapOrdered(buildFragments, tasks(), processes):
+        for fragment in fragments:
+          writer.writeFragment(fragment)
+        for method in methods:
+          add_string(detection_methods, method)
     else:
-      pathToIssue = fixLocation
-
-    # if pathToIssue is still blank, then we need to look at the URLs extracted from above
-    if pathToIssue == "":
-      for url in urls:
-        pathToIssue += url +"," 
-      # trim last ,
-      pathToIssue = pathToIssue[:-1]
-
-    if "https" in pathToIssue:
-      issueType="url"
-      
-
-    location = ET.SubElement(finding, 'location', type=issueType, path=pathToIssue)
-    # variants = ET.SubElement(location, 'variants')
-
-    # # Loop through instances and add variants to xml
-    # I need more info here since all the instance data in my example are blank.    
-    # for evidence in instances:
-    #   variant_element = ET.SubElement(variants, 'variant')
-    #   bodyText = "N/A"
-    #   links = evidence.get("_links")
-    
-    
-    # Parse the 'report' element instead of the 'root' element
-    dom = xml.dom.minidom.parseString(ET.tostring(report, 'utf-8'))
-    pretty_xml_as_string = dom.toprettyxml()
-    # Write XML to file
-    with open(outputFile, 'w', encoding='utf-8') as f:
-        f.write(pretty_xml_as_string)
+      # Loop through issues and populate the SRM findings field
+      for issue in issues:
+        writer.writeFinding(createFinding(issue, toolName, packageName, detection_methods))
 
   # return list of detection methods to add to SRM if needed
   return detection_methods
 
+def convertFile(inputFile, indent=True):
+  # Runs in the worker processes of createMergedSRMXML, converts a whole results file to serialized findings
+  issues, toolName, testDate, packageName, metadata = openResults(inputFile)
+  print(f"Converting {inputFile} to SRM XML format...")
+  with issues:
+    fragments, detection_methods = buildFragments(issues, toolName, packageName, indent)
+  return fragments, detection_methods, toolName, testDate, metadata
+
+def createMergedSRMXML(inputFiles, outputFile, indent=True, processes=1, groupKey=None):
+  # Converts several MAST json results files (e.g. one per app build) into a single report, the files are converted
+  # in up to processes worker processes and their findings are written in the order of inputFiles.
+  # With groupKey the files are grouped by the value of that key in their metadata, and one report is written per
+  # group next to outputFile (named after the group), files without the key go to outputFile.
+  # The report date and tool are the ones of the first file of the report.
+  # Returns the {group: report file} written (the group is None for outputFile) and the merged detection methods.
+  detection_methods = []
+  writers = {}
+  tasks = ((inputFile, (inputFile, indent)) for inputFile in inputFiles)
+  try:
+    for inputFile, (fragments, methods, toolName, testDate, metadata) in parallel_convert.mapOrdered(convertFile, tasks, processes):
+      group = metadata.get(groupKey) if groupKey else None
+      group = str(group) if group not in (None, "") else None
+      writer = writers.get(group)
+      if writer is None:
+        writer = writers[group] = SRMXMLWriter(groupFileName(outputFile, group), date=testDate, tool=toolName, indent=indent)
+        writer.open()
+      for fragment in fragments:
+        writer.writeFragment(fragment)
+      for method in methods:
+        add_string(detection_methods, method)
+  except BaseException:
+    for writer in writers.values():
+      writer.abort()
+    raise
+  for writer in writers.values():
+    writer.close()
+  for group, writer in writers.items():
+    print(f"Successfully wrote {writer.findingCount} findings to {writer.outputFile}")
+  return {group: writer.outputFile for group, writer in writers.items()}, detection_methods
+
+def groupFileName(outputFile, group):
+  if group is None:
+    return outputFile
+  root, extension = os.path.splitext(outputFile)
+  # keep the group usable in a file name, e.g. a branch like release/1.2
+  return root + "-" + "".join(c if c.isalnum() or c in "._-" else "_" for c in group) + extension
+
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   parser.add_argument('--inputFileName', help='Name of the json export to be converted to SRM XML format')
   parser.add_argument('--outputFileName', default="srm-output.xml", help='Name of the SRM XML output file.')
+  parser.add_argument('--compact', action='store_true', help='Write the SRM XML without indentation to reduce the output file size.')
+  parser.add_argument('--processes', type=int, default=int(os.environ.get('SRM_CONVERT_PROCESSES', 1)), help='Optional, number of worker processes building the SRM XML findings, more than 1 converts large result files on several cores. The output is the same as with a single process.')
   args = parser.parse_args()
 
   if not args.inputFileName or not args.outputFileName:
@@ -209,4 +254,4 @@ if __name__ == '__main__':
   else:
     outputFile = args.outputFileName
     inputFile = args.inputFileName
-    createSRMXML(inputFile,outputFile)
+    createSRMXML(inputFile,outputFile, indent=not args.compact, processes=args.processes)
@@ -19,6 +19,13 @@ RUNTIME_CMD="/home/sig-user/import_mast_results.py /data/${IMPORT_FILE}"  #<-- C
 
 # copy files from parent directory needed in the docker image:
 cp ../../srmPost.py .
+cp ../../srm_xml_writer.py .
+cp ../../json_stream.py .
+cp ../../field_mapping.py .
+cp ../../parallel_convert.py .
+cp ../../run_metrics.py .
+cp ../../http_client.py .
+cp ../../srm_client.py .
 cp ../convert_mast_results.py .
 cp ../import_mast_results.py .
 
@@ -30,6 +37,13 @@ fi
 
 # remove files that were copied
 rm srmPost.py
+rm srm_xml_writer.py
+rm json_stream.py
+rm field_mapping.py
+rm parallel_convert.py
+rm run_metrics.py
+rm http_client.py
+rm srm_client.py
 rm convert_mast_results.py
 rm import_mast_results.py
 
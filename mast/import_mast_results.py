@@ -4,48 +4,76 @@ import sys
 # setting path so we can include functions from the srmPost python file.
 sys.path.append('../')
 import argparse
+import glob
 import os
 import convert_mast_results
 import srmPost
+import srm_client
 
 def get_mast_results(location):
-  file = ""
-  return file
+  # The MAST json results files to import, location is a results file, a directory containing them or a glob pattern
+  # e.g. "builds/*/mast-*.json". The files are returned in name order so the merged report is the same on every run.
+  if os.path.isdir(location):
+    files = [os.path.join(location, name) for name in os.listdir(location) if name.lower().endswith(".json")]
+  elif any(c in location for c in "*?["):
+    files = glob.glob(location)
+  else:
+    files = [location]
+  return sorted(files)
+
+def main(sourcePath, srmProjectName, projectBranchName, srmURL, srmAPIKey, zipUpload=False, processes=None, branchKey=None):
+  sourceFiles = get_mast_results(sourcePath)
+  if not sourceFiles:
+    print(f"ERROR: No MAST json results found in {sourcePath}")
+    sys.exit(2)
+  # by default the files are converted on as many cores as there are files
+  if processes is None:
+    processes = min(len(sourceFiles), os.cpu_count() or 1)
 
-def main(sourcePath, srmProjectName, projectBranchName, srmURL, srmAPIKey):
   # Convert the data to SRM XML Format
-  print(f"Converting {sourcePath} to SRM XML format...")
   importFile = "sourceSRMXML.xml"
-  detection_methods = convert_mast_results.createSRMXML(sourcePath, importFile)
+  if len(sourceFiles) == 1 and not branchKey:
+    print(f"Converting {sourceFiles[0]} to SRM XML format...")
+    detection_methods = convert_mast_results.createSRMXML(sourceFiles[0], importFile, processes=processes)
+    reports = {None: importFile}
+  else:
+    # all the files are merged into one report (one per branch with branchKey), so SRM runs one analysis instead of one per file
+    print(f"Converting {len(sourceFiles)} MAST results files from {sourcePath} to SRM XML format...")
+    reports, detection_methods = convert_mast_results.createMergedSRMXML(sourceFiles, importFile, processes=processes, groupKey=branchKey)
 
   # add detection methods, if needed
+  srmURL = srm_client.normalizeURL(srmURL)
   if detection_methods != []:
     headers = {'Authorization': 'Bearer ' + srmAPIKey}
-    # add trailing slash to srm url if needed:
-    if not srmURL.endswith("/"):
-        srmURL += "/"  
-    for method in detection_methods:
-      srmPost.create_detection_method(srmURL, method, headers)
-
-  # Push the results to SRM
-  if projectBranchName is None or projectBranchName == "":
-    print(f"Uploading results to {srmURL} project {srmProjectName}...")
-  else:
-    print(f"Uploading results to {srmURL} Project: {srmProjectName} Branch: {projectBranchName}...")    
-  srmPost.main(srmAPIKey, srmURL, srmProjectName, importFile, projectBranchName)
+    srmPost.reconcile_detection_methods(srmURL, detection_methods, headers)
+
+  # Push the results to SRM, once per report
+  for branch, reportFile in reports.items():
+    branchName = branch or projectBranchName
+    if branchName is None or branchName == "":
+      print(f"Uploading results to {srmURL} project {srmProjectName}...")
+    else:
+      print(f"Uploading results to {srmURL} Project: {srmProjectName} Branch: {branchName}...")
+    srmPost.main(srmAPIKey, srmURL, srmProjectName, reportFile, branchName, compress=zipUpload)
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
-  parser.add_argument('sourcePath', help='Location of the MAST json results file to be imported into SRM.')
+  parser.add_argument('sourcePath', help='Location of the MAST json results file to be imported into SRM, or a directory containing several results files, or a glob pattern matching them (quote it), e.g. "builds/*.json". Several files are imported in one report.')
   parser.add_argument('--srmProjectName', default=os.environ.get('SRM_PROJECT_NAME'), help='Name of the project in SRM to import the results to, if the project does not exist it will be created. If not provided, the value of the SRM_PROJECT_NAME environment variable is used.')
   parser.add_argument('--srmURL', default=os.environ.get('SRM_URL'), help='SRM URL to import the results to. If not provided, the value of the SRM_URL environment variable is used.')
   parser.add_argument('--srmAPIKey', default=os.environ.get('SRM_API_KEY'), help='The SRM API Key used to authenticate to SRM. If not provided, the value of the SRM_API_KEY environment variable is used.')
   parser.add_argument('--projectBranchName', default=os.environ.get('SRM_PROJECT_BRANCH_NAME'), required=False ,help='Optional, SRM project branch name to run the analysis on, if the branch does not currently exist, if will be created with the default branch as the parent. If not provided, the value of the SRM_PROJECT_BRANCH_NAME environment variable is used if that is not set the default project branch will be used.')
-
+  parser.add_argument('--zipUpload', action='store_true', default=os.environ.get('SRM_UPLOAD_ZIP', '').lower() in ('1', 'true', 'yes'), help='Optional, compress the SRM XML into a zip archive before uploading it to SRM. If not provided, the value of the SRM_UPLOAD_ZIP environment variable is used.')
+  parser.add_argument('--processes', type=int, default=int(os.environ['SRM_CONVERT_PROCESSES']) if os.environ.get('SRM_CONVERT_PROCESSES') else None, help='Optional, number of worker processes converting the MAST results, more than 1 converts large result files (or several files) on several cores. If not provided, the value of the SRM_CONVERT_PROCESSES environment variable is used, if that is not set several files are converted on up to one process per core.')
+  parser.add_argument('--branchKey', default=os.environ.get('SRM_BRANCH_KEY'), help='Optional, key of the MAST results metadata (e.g. versionNumber) whose value is used as the SRM branch name. The files are grouped by that value and one report is uploaded per branch, files without the key are uploaded to --projectBranchName. If not provided, the value of the SRM_BRANCH_KEY environment variable is used.')
 
   args = parser.parse_args()
 
   if not args.sourcePath or not args.srmProjectName or not args.srmURL or not args.srmAPIKey:
     parser.print_help()
   else:     
-    main(args.sourcePath, args.srmProjectName, args.projectBranchName, args.srmURL, args.srmAPIKey)
+    try:
+      main(args.sourcePath, args.srmProjectName, args.projectBranchName, args.srmURL, args.srmAPIKey, args.zipUpload, args.processes, args.branchKey)
+    finally:
+      # close the pooled SRM connections
+      srm_client.closeClients()
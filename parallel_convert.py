@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+# Runs the CPU bound part of a conversion (building and serializing the findings) on several cores, e.g.:
+#   tasks = ((chunk, (chunk, toolName, indent)) for chunk in chunks(issues))
+#   for chunk, fragments in mapOrdered(buildFragments, tasks, processes=4):
+#     ...write the fragments of the chunk...
+# tasks yields (key, args) pairs, function(*args) is run in a worker process and (key, result) pairs are yielded in
+# the order of the tasks whatever the order the workers finish them, so the report is the same as a serial run.
+# At most window tasks are in flight, the tasks generator is only read as fast as the workers keep up, so the
+# parent can do its own work (e.g. downloading the evidence of the next chunk) in it without buffering the whole input.
+# function must be a module level function, it is pickled by name to the workers.
+def mapOrdered(function, tasks, processes, window=None):
+  if processes <= 1:
+    for key, args in tasks:
+      yield key, function(*args)
+    return
+  # multiprocessing is only imported when used, it adds about 25ms to the startup of every script importing the converters
+  import multiprocessing
+  from concurrent.futures import ProcessPoolExecutor
+  window = window or processes * 2
+  # spawn instead of fork, the parent has threads (evidence downloads, http sessions) a forked child would inherit in an unknown state
+  with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+    inFlight = deque()
+    for key, args in tasks:
+      inFlight.append((key, executor.submit(function, *args)))
+      if len(inFlight) >= window:
+        key, future = inFlight.popleft()
+        yield key, future.result()
+    while inFlight:
+      key, future = inFlight.popleft()
+      yield key, future.result()
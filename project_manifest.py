@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import json
+
+# The list of Polaris/SRM project pairs shared by import_scan_results.py --manifest and configureToolService.py --mappingFile
+
+def loadManifest(manifestFile):
+  # The manifest lists the project pairs to import, either as json:
+  #   {"projects": [{"sourceProjectName": "webapp", "srmProjectName": "WebApp"}, ...]}
+  # or as toml:
+  #   [[projects]]
+  #   sourceProjectName = "webapp"
+  #   srmProjectName = "WebApp"
+  # srmProjectName is optional and defaults to the source project name.
+  if manifestFile.lower().endswith(".toml"):
+    try:
+      import tomllib
+    except ImportError:
+      # python < 3.11 (the docker image), tomllib is the standard library version of tomli
+      import tomli as tomllib
+    with open(manifestFile, 'rb') as f:
+      manifest = tomllib.load(f)
+  else:
+    with open(manifestFile, 'r', encoding='utf-8') as f:
+      manifest = json.load(f)
+
+  projects = []
+  for entry in manifest.get("projects", []):
+    sourceProjectName = entry.get("sourceProjectName")
+    if not sourceProjectName:
+      print(f"ERROR: Skipping manifest entry without a sourceProjectName: {entry}")
+      continue
+    projects.append((sourceProjectName, entry.get("srmProjectName") or sourceProjectName))
+  return projects
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import pull_dast_results
+import convert_dast_results
+from evidence_cache import EvidenceCache
+from sync_state import SyncState
+from lookup_cache import LookupCache
+import run_metrics
+
+# Pulls the DAST issues from Polaris and converts them to SRM XML in one process, the issues are handed from the
+# pull to the converter one page at a time as they arrive instead of going through a json export file.
+
+def main(api_url, projectName, apiKey, outputFile, exportFile=None, indent=True, maxWorkers=8, maxConnectionsPerHost=8, batchSize=100, pageSize=500, prefetch=1, cache=None, state=None, session=None, portfolioID=None, idCache=None, maxBodySize=None, processes=1):
+  # one pooled session for the issue pages and the request/response details, both come from the same polaris host
+  ownSession = session is None
+  if ownSession:
+    session = convert_dast_results.createSession(maxConnectionsPerHost)
+
+  issues = pull_dast_results.streamIssues(api_url, projectName, apiKey, pageSize, prefetch, session, portfolioID, idCache)
+  # the json export is only written when asked for, e.g. to debug a conversion
+  if exportFile:
+    issues = pull_dast_results.exportIssues(issues, exportFile)
+  print(f"Converting issues to SRM XML format...")
+  findingCount = convert_dast_results.convertIssues(issues, outputFile, apiKey, indent, maxWorkers, maxConnectionsPerHost, batchSize, cache, state, session, maxBodySize, processes)
+  print(f"Successfully wrote {findingCount} findings to {outputFile}")
+
+  if ownSession:
+    session.close()
+  return findingCount
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--projectName', default=os.environ.get('POLARIS_PROJECT_NAME'), help='Polaris project name')
+  parser.add_argument('--url', default=os.environ.get('POLARIS_URL'), help='Polaris URL')
+  parser.add_argument('--apiKey', default=os.environ.get('POLARIS_API_KEY'), help='API key for authentication to polaris')
+  parser.add_argument('--outputFileName', default="srm-output.xml", help='Name of the SRM XML output file.')
+  parser.add_argument('--exportFile', help='Optional, also write the issues pulled from polaris to this json file, e.g. for debugging the conversion.')
+  parser.add_argument('--compact', action='store_true', help='Write the SRM XML without indentation to reduce the output file size.')
+  parser.add_argument('--pageSize', type=int, default=500, help='Number of issues requested from polaris per page')
+  parser.add_argument('--prefetch', type=int, default=1, help='Number of pages downloaded ahead while the current page is converted, 0 disables prefetching')
+  parser.add_argument('--maxWorkers', type=int, default=int(os.environ.get('POLARIS_MAX_WORKERS', 8)), help='Maximum number of request/response details downloaded from Polaris at the same time.')
+  parser.add_argument('--maxConnectionsPerHost', type=int, default=int(os.environ.get('POLARIS_MAX_CONNECTIONS', 8)), help='Maximum number of open connections to the Polaris host.')
+  parser.add_argument('--batchSize', type=int, default=100, help='Number of issues whose request/response details are downloaded together before their findings are written.')
+  parser.add_argument('--processes', type=int, default=int(os.environ.get('SRM_CONVERT_PROCESSES', 1)), help='Optional, number of worker processes building the SRM XML findings, more than 1 converts large exports on several cores. The output is the same as with a single process.')
+  parser.add_argument('--maxBodySize', type=int, default=int(os.environ.get('POLARIS_MAX_BODY_SIZE', 0)), help='Optional, maximum size in bytes of the request/response bodies written to the SRM XML, longer bodies are cut and marked as truncated. 0 keeps the whole bodies.')
+  parser.add_argument('--cacheDir', default=os.environ.get('POLARIS_EVIDENCE_CACHE_DIR'), help='Optional, directory used to cache request/response details between runs, if not set nothing is cached.')
+  parser.add_argument('--cacheMaxMB', type=int, default=512, help='Maximum size of the request/response details cache in MB.')
+  parser.add_argument('--cacheTTLHours', type=float, default=168, help='Number of hours cached request/response details are used before they are checked with Polaris again.')
+  parser.add_argument('--stateDir', default=os.environ.get('SRM_SYNC_STATE_DIR'), help='Optional, directory used to remember the issues converted by the previous run, unchanged issues are not converted again.')
+  parser.add_argument('--idCacheFile', default=os.environ.get('POLARIS_ID_CACHE_FILE'), help='Optional, file used to cache the polaris portfolio ids of the project between runs')
+  parser.add_argument('--idCacheTTLHours', type=float, default=24, help='Number of hours cached polaris portfolio ids are used before they are looked up again')
+  parser.add_argument('--metrics', action='store_true', default=os.environ.get('SRM_RUN_METRICS', '').lower() in ('1', 'true', 'yes'), help='Optional, write the time spent per stage, the HTTP calls per endpoint and the peak memory of the run to a <result file>-metrics.json report next to the output file.')
+  parser.add_argument('--prometheus', action='store_true', default=os.environ.get('SRM_RUN_METRICS_PROMETHEUS', '').lower() in ('1', 'true', 'yes'), help='Optional, with --metrics also write the report as a <result file>-metrics.prom Prometheus textfile.')
+  args = parser.parse_args()
+
+  if not args.projectName or not args.url or not args.apiKey or not args.outputFileName:
+    parser.print_help()
+  else:
+    cache = None
+    if args.cacheDir:
+      cache = EvidenceCache(args.cacheDir, args.cacheMaxMB * 1024 * 1024, args.cacheTTLHours * 3600)
+    state = SyncState(args.stateDir) if args.stateDir else None
+    idCache = LookupCache(args.idCacheFile, args.idCacheTTLHours * 3600) if args.idCacheFile else None
+    if args.metrics:
+      run_metrics.start()
+    try:
+      main(args.url, args.projectName, args.apiKey, args.outputFileName, args.exportFile, indent=not args.compact, maxWorkers=args.maxWorkers, maxConnectionsPerHost=args.maxConnectionsPerHost, batchSize=args.batchSize, pageSize=args.pageSize, prefetch=args.prefetch, cache=cache, state=state, idCache=idCache, maxBodySize=args.maxBodySize, processes=args.processes)
+    finally:
+      # the report is written for failed runs as well, they are the ones worth looking at
+      if args.metrics:
+        run_metrics.stop().write(args.outputFileName, args.prometheus)
+    # in tool orchestration mode SRM imports the output file itself, so the state is saved once the file is written
+    if state is not None:
+      state.commit()
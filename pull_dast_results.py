@@ -2,43 +2,55 @@
 
 import json
 import os
-import requests
 import argparse
 import sys
 import pprint
+import queue
+import threading
+from urllib.parse import urljoin
+from lookup_cache import LookupCache
+import run_metrics
+import http_client
 
-def getPortfolioId(api_url,headers):
+class StaleIdError(Exception):
+    # polaris answered 404 for an id we used, e.g. an id from the lookup cache that no longer exists
+    pass
+
+def getPortfolioId(api_url,headers,session=None):
     endpoint="/api/portfolio/portfolios"
-    response = requests.get(f"{api_url}/{endpoint}", headers=headers)
+    response = (session or http_client).get(f"{api_url}/{endpoint}", headers=headers)
     statusCode=response.status_code
 
     if statusCode == 200:
         # parse the response
         portfolioID = response.json()["_items"][0]["id"]
     else:
-      print("ERROR: Failed to retrieve portfolio id, http request failed with code: "+ statusCode)
+      print(f"ERROR: Failed to retrieve portfolio id, http request failed with code: {statusCode}")
       sys.exit(2)
 
     return portfolioID
 
-def getPortfolioItemId(api_url,headers,portfolioID,projectName):
+def getPortfolioItemId(api_url,headers,portfolioID,projectName,session=None):
     endpoint=f"/api/portfolio/portfolios/{portfolioID}/portfolio-items?_filter=name=={projectName}&_limit=10"
-    response = requests.get(f"{api_url}/{endpoint}", headers=headers)
+    response = (session or http_client).get(f"{api_url}/{endpoint}", headers=headers)
     statusCode=response.status_code
 
     if statusCode == 200:
         # parse the response
         #pprint.pprint(response.json(), compact=True)
         portfolioItemID = response.json()["_items"][0]["id"]
+    elif statusCode == 404:
+      # the portfolio id no longer exists, e.g. a stale id from the lookup cache
+      raise StaleIdError(response.text)
     else:
-      print("ERROR: Failed to retrieve project id, http request failed with code: "+ statusCode)
+      print(f"ERROR: Failed to retrieve project id, http request failed with code: {statusCode}")
       sys.exit(2)
 
     return portfolioItemID
 
-def getPortfolioSubItemId(api_url,headers,portfolioItemID):
+def getPortfolioSubItemId(api_url,headers,portfolioItemID,session=None):
     endpoint=f"/api/portfolio/portfolio-items/{portfolioItemID}/portfolio-sub-items"
-    response = requests.get(f"{api_url}/{endpoint}", headers=headers)
+    response = (session or http_client).get(f"{api_url}/{endpoint}", headers=headers)
     statusCode=response.status_code
 
     portfolioSubItemID=""
@@ -59,39 +71,191 @@ def getPortfolioSubItemId(api_url,headers,portfolioItemID):
 
     return portfolioSubItemID
 
-def getIssues(api_url, headers, portfolioSubItemID, exportFile):
-    endpoint=f"/api/specialization-layer-service/issues/_actions/list?portfolioSubItemId={portfolioSubItemID}&testId=latest&_first=500&_includeAttributes=true"
-    response = requests.get(f"{api_url}/{endpoint}", headers=headers)
+def getIssuePage(url, headers, session=None):
+    with run_metrics.stage("issue fetch"):
+      response = (session or http_client).get(url, headers=headers)
     statusCode=response.status_code
 
-    if statusCode == 200:
-      # parse the response, we only want the issues not all the other stuff
-      issues = response.json()
-      #pprint.pprint(response.json(), compact=True)
-      print("Writing issue json file...")
-      with open(exportFile, 'w', encoding='utf-8') as f:
-        json.dump(issues, f, ensure_ascii=False, indent=4)
-    else:
+    if statusCode == 404:
+      raise StaleIdError(response.text)
+    elif statusCode != 200:
       print(f"ERROR: Failed to retrieve DAST Issues, http request failed with code: {statusCode}, ERROR MESSAGE: ")
       pprint.pprint(response.json(), compact=True)
       sys.exit(2)
 
-    print(f"Successfully wrote {exportFile}")
+    page = response.json()
+    # follow the next link (which carries the cursor for the next page) until the API stops returning one
+    nextUrl = None
+    for link in page.get("_links", []):
+      if link.get("rel") == "next" and link.get("href"):
+        nextUrl = urljoin(url, link.get("href"))
+    return page.get("_items", []), nextUrl
+
+def getIssuePages(api_url, headers, portfolioSubItemID, pageSize=500, prefetch=1, session=None):
+    # Generator returning one page of issues at a time, with prefetch > 0 a background thread keeps
+    # up to prefetch pages downloaded ahead of the page currently being processed.
+    endpoint=f"/api/specialization-layer-service/issues/_actions/list?portfolioSubItemId={portfolioSubItemID}&testId=latest&_first={pageSize}&_includeAttributes=true"
+    url = f"{api_url}/{endpoint}"
+
+    if prefetch <= 0:
+      visited = set()
+      while url is not None and url not in visited:
+        visited.add(url)
+        items, url = getIssuePage(url, headers, session)
+        yield items
+      return
+
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+      # gives up once the consumer stopped (e.g. the conversion failed), instead of blocking forever on a full queue
+      while not stop.is_set():
+        try:
+          pages.put(item, timeout=0.5)
+          return True
+        except queue.Full:
+          pass
+      return False
+
+    def fetchPages(url):
+      visited = set()
+      try:
+        while url is not None and url not in visited and not stop.is_set():
+          visited.add(url)
+          items, url = getIssuePage(url, headers, session)
+          if not put(items):
+            return
+        put(None)
+      except BaseException as e:
+        # hand the error (including the sys.exit from getIssuePage) to the consuming thread
+        put(e)
+
+    fetcher = threading.Thread(target=fetchPages, args=(url,), daemon=True)
+    fetcher.start()
+    try:
+      while True:
+        page = pages.get()
+        if page is None:
+          break
+        if isinstance(page, BaseException):
+          raise page
+        yield page
+    finally:
+      stop.set()
+      # release the pages downloaded ahead, the fetcher sees stop at its next put
+      while True:
+        try:
+          pages.get_nowait()
+        except queue.Empty:
+          break
 
-def main(api_url, projectName, exportFile, apiKey):
+def exportIssues(issues, exportFile):
+    # Generator passing the issues through unchanged while writing them to the export file as they go by.
+    # We only want the issues not all the other stuff, so the export only contains the "_items" list.
+    print("Writing issue json file...")
+    issueCount = 0
+    with open(exportFile, 'w', encoding='utf-8') as f:
+      f.write('{"_items": [')
+      for issue in issues:
+        f.write(",\n" if issueCount > 0 else "\n")
+        json.dump(issue, f, ensure_ascii=False)
+        issueCount += 1
+        yield issue
+      f.write("\n]}\n")
+
+    print(f"Successfully wrote {issueCount} issues to {exportFile}")
+
+def portfolioCacheKey(api_url):
+  return f"{api_url.rstrip('/')}|portfolio"
+
+def getCachedPortfolioId(api_url, headers, session=None, idCache=None):
+  # the portfolio id is the same for every project, so it is cached on its own
+  cacheKey = portfolioCacheKey(api_url)
+  portfolioID = idCache.get(cacheKey) if idCache is not None else None
+  if portfolioID is None:
+    portfolioID = getPortfolioId(api_url, headers, session)
+    if idCache is not None:
+      idCache.set(cacheKey, portfolioID)
+  return portfolioID
+
+def resolveProjectIds(api_url, headers, projectName, session=None, portfolioID=None, idCache=None):
+  with run_metrics.stage("portfolio resolution"):
+    # get portfolio ID, unless the caller already resolved it
+    if portfolioID is None:
+      portfolioID = getCachedPortfolioId(api_url, headers, session, idCache)
+    print("Portfolio ID: "+portfolioID)
+    # get project ID
+    try:
+      portfolioItemID = getPortfolioItemId(api_url,headers, portfolioID, projectName, session)
+    except StaleIdError:
+      # the cached (or passed in) portfolio id is stale: drop it, resolve it again and retry once
+      print(f"Polaris portfolio ID {portfolioID} is no longer valid, resolving it again...")
+      if idCache is not None:
+        idCache.invalidate(portfolioCacheKey(api_url))
+      portfolioID = getCachedPortfolioId(api_url, headers, session, idCache)
+      print("Portfolio ID: "+portfolioID)
+      try:
+        portfolioItemID = getPortfolioItemId(api_url,headers, portfolioID, projectName, session)
+      except StaleIdError as e:
+        print(f"ERROR: Failed to retrieve project id, http request failed with code: 404, ERROR MESSAGE: {e}")
+        sys.exit(2)
+    print("Portfolio Item ID: "+portfolioItemID)
+
+    # get projects (or as Polaris calls them SubPortfolioItemIDs)
+    dastSubItemID = getPortfolioSubItemId(api_url, headers, portfolioItemID, session)
+    print("Portfolio DAST SubItem ID: "+ dastSubItemID)
+
+  return {"portfolioID": portfolioID, "portfolioItemID": portfolioItemID, "dastSubItemID": dastSubItemID}
+
+def streamIssues(api_url, projectName, apiKey, pageSize=500, prefetch=1, session=None, portfolioID=None, idCache=None):
+  # Generator returning the DAST issues of the project one at a time as the pages arrive from polaris,
+  # so they can be handed straight to the converter without going through an export file.
   headers = {'Api-token': apiKey}
-  # get portfolio ID
-  portfolioID = getPortfolioId(api_url, headers)
-  print("Portfolio ID: "+portfolioID)
-  # get project ID
-  portfolioItemID = getPortfolioItemId(api_url,headers, portfolioID, projectName)
-  print("Portfolio Item ID: "+portfolioItemID)
+  # reuse one keep-alive connection for all the requests to polaris, batch imports pass in a session shared by all projects
+  ownSession = session is None
+  if ownSession:
+    session = run_metrics.instrument(http_client.RetryingSession())
 
-  # get projects (or as Polaris calls them SubPortfolioItemIDs)
-  dastSubItemID = getPortfolioSubItemId(api_url, headers, portfolioItemID)
-  print("Portfolio DAST SubItem ID: "+ dastSubItemID)
+  # The ids almost never change, so they are taken from the lookup cache when possible. If polaris
+  # answers 404 for cached ids they are stale: drop them, resolve them again and retry once.
+  cacheKey = f"{api_url.rstrip('/')}|{projectName}"
+  issueCount = 0
+  try:
+    for attempt in range(2):
+      ids = idCache.get(cacheKey) if idCache is not None else None
+      fromCache = ids is not None
+      if fromCache:
+        print(f"Using cached Polaris ids for {projectName}, DAST SubItem ID: {ids['dastSubItemID']}")
+      else:
+        ids = resolveProjectIds(api_url, headers, projectName, session, portfolioID, idCache)
+        if idCache is not None and ids["dastSubItemID"] != "":
+          idCache.set(cacheKey, ids)
 
-  dastIssues = getIssues(api_url, headers, dastSubItemID, exportFile)   
+      try:
+        for page in getIssuePages(api_url, headers, ids["dastSubItemID"], pageSize, prefetch, session):
+          for issue in page:
+            issueCount += 1
+            yield issue
+        break
+      except StaleIdError as e:
+        # issues already handed out can't be taken back, so only retry if the first page failed
+        if not fromCache or issueCount > 0:
+          print(f"ERROR: Failed to retrieve DAST Issues, http request failed with code: 404, ERROR MESSAGE: {e}")
+          sys.exit(2)
+        print(f"Cached Polaris ids for {projectName} are no longer valid, resolving them again...")
+        idCache.invalidate(cacheKey)
+        # a stale portfolio id passed in by the caller is resolved again as well
+        idCache.invalidate(portfolioCacheKey(api_url))
+        portfolioID = None
+  finally:
+    if ownSession:
+      session.close()
+
+def main(api_url, projectName, exportFile, apiKey, pageSize=500, prefetch=1, session=None, portfolioID=None, idCache=None):
+  # Stream every page of issues into the export file as it arrives, only the pages being prefetched are held in memory.
+  issues = streamIssues(api_url, projectName, apiKey, pageSize, prefetch, session, portfolioID, idCache)
+  return sum(1 for issue in exportIssues(issues, exportFile))
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
@@ -99,6 +263,10 @@ if __name__ == '__main__':
   parser.add_argument('--projectName', nargs='?', default=os.environ.get('POLARIS_PROJECT_NAME'), help='Polaris project name')
   parser.add_argument('--url', default=os.environ.get('POLARIS_URL'), help='Polaris URL')
   parser.add_argument('--apiKey', default=os.environ.get('POLARIS_API_KEY'), help='API key for authentication to polaris')
+  parser.add_argument('--pageSize', type=int, default=500, help='Number of issues requested from polaris per page')
+  parser.add_argument('--prefetch', type=int, default=1, help='Number of pages downloaded ahead while the current page is written to the export, 0 disables prefetching')
+  parser.add_argument('--idCacheFile', default=os.environ.get('POLARIS_ID_CACHE_FILE'), help='Optional, file used to cache the polaris portfolio ids of the project between runs')
+  parser.add_argument('--idCacheTTLHours', type=float, default=24, help='Number of hours cached polaris portfolio ids are used before they are looked up again')
   args = parser.parse_args()
 
   api_url = args.url
@@ -106,4 +274,6 @@ if __name__ == '__main__':
   exportFile = args.fileName
   apiKey = args.apiKey
 
-  main(api_url, projectName, exportFile, apiKey)
+  idCache = LookupCache(args.idCacheFile, args.idCacheTTLHours * 3600) if args.idCacheFile else None
+
+  main(api_url, projectName, exportFile, apiKey, args.pageSize, args.prefetch, idCache=idCache)
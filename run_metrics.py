@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+try:
+  import resource
+except ImportError:
+  # not available on windows, the peak memory is left out of the report there
+  resource = None
+
+# Records where the time of a run goes, so a slow analysis leaves behind data that can be aggregated across runs:
+#   - wall and CPU time per stage (portfolio resolution, issue fetch, evidence fetch, xml build, serialization, upload)
+#   - count, bytes, errors and latency percentiles of the HTTP calls per endpoint
+#   - peak memory (RSS) of the process
+# Recording is off until start() is called, the stage() and responseHook() calls spread through the scripts do
+# nothing until then. The CPU time of a stage is the CPU time of the thread that ran it, e.g. the evidence fetch
+# stage does not include the CPU time of its download threads.
+class RunMetrics:
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.started = datetime.now(timezone.utc)
+    self.startWall = time.perf_counter()
+    self.startCpu = time.process_time()
+    self.stages = {}
+    self.http = {}
+
+  def addStage(self, name, wall, cpu):
+    with self.lock:
+      stage = self.stages.setdefault(name, {"count": 0, "wallSeconds": 0.0, "cpuSeconds": 0.0})
+      stage["count"] += 1
+      stage["wallSeconds"] += wall
+      stage["cpuSeconds"] += cpu
+
+  def addRequest(self, endpoint, latency, sent, received, error):
+    with self.lock:
+      request = self.http.setdefault(endpoint, {"count": 0, "errors": 0, "bytesSent": 0, "bytesReceived": 0, "latencies": []})
+      request["count"] += 1
+      request["errors"] += 1 if error else 0
+      request["bytesSent"] += sent
+      request["bytesReceived"] += received
+      request["latencies"].append(latency)
+
+  def report(self):
+    with self.lock:
+      http = {}
+      for endpoint, request in sorted(self.http.items()):
+        latencies = sorted(request["latencies"])
+        http[endpoint] = {key: value for key, value in request.items() if key != "latencies"}
+        http[endpoint]["latencySeconds"] = {
+          "p50": percentile(latencies, 50),
+          "p90": percentile(latencies, 90),
+          "p99": percentile(latencies, 99),
+          "max": latencies[-1] if latencies else 0,
+          "sum": sum(latencies)
+        }
+      return {
+        "started": self.started.isoformat(),
+        "wallSeconds": time.perf_counter() - self.startWall,
+        "cpuSeconds": time.process_time() - self.startCpu,
+        "peakRSSBytes": peakRSS(),
+        "stages": {name: dict(stage) for name, stage in self.stages.items()},
+        "http": http
+      }
+
+  def write(self, resultFile, prometheus=False):
+    # the reports are written next to the result file, e.g. sourceSRMXML.xml -> sourceSRMXML-metrics.json/.prom
+    base = os.path.splitext(resultFile)[0] + "-metrics"
+    report = self.report()
+    paths = [base + ".json"]
+    writeFile(paths[0], json.dumps(report, indent=2) + "\n")
+    if prometheus:
+      paths.append(base + ".prom")
+      writeFile(paths[1], prometheusText(report))
+    print(f"Run metrics written to {', '.join(paths)}")
+    return paths
+
+active = None
+
+def start():
+  global active
+  active = RunMetrics()
+  return active
+
+def stop():
+  global active
+  metrics = active
+  active = None
+  return metrics
+
+@contextmanager
+def stage(name):
+  metrics = active
+  wall = time.perf_counter()
+  cpu = time.thread_time()
+  try:
+    yield
+  finally:
+    if metrics is not None:
+      metrics.addStage(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+def endpointName(method, url):
+  # group the calls by host and path, with the ids in the path replaced so e.g. every evidence download is one endpoint
+  parsed = urlparse(url)
+  segments = [("{id}" if re.search(r'\d', segment) else segment) for segment in re.sub(r'/+', '/', parsed.path).split("/")]
+  return f"{method} {parsed.netloc}{'/'.join(segments)}"
+
+def responseHook(response, *args, **kwargs):
+  # requests response hook, add it to a session with instrument() or to a single call with hooks=HOOKS
+  metrics = active
+  if metrics is None:
+    return
+  request = response.request
+  sent = int(request.headers.get("Content-Length", 0) or 0)
+  metrics.addRequest(endpointName(request.method, request.url), response.elapsed.total_seconds(), sent, len(response.content), response.status_code >= 400)
+
+HOOKS = {'response': [responseHook]}
+
+def instrument(session):
+  session.hooks['response'].append(responseHook)
+  return session
+
+def percentile(values, p):
+  # nearest rank percentile of a sorted list
+  if not values:
+    return 0
+  return values[max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))]
+
+def peakRSS():
+  if resource is None:
+    return None
+  # ru_maxrss is in KiB on linux and in bytes on macOS
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def prometheusText(report):
+  def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+  lines = []
+  def metric(name, kind, help, samples):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+      labelText = ",".join(f'{key}="{label(v)}"' for key, v in labels.items())
+      lines.append(f"{name}{{{labelText}}} {value}" if labelText else f"{name} {value}")
+
+  metric("srm_connector_run_wall_seconds", "gauge", "Wall time of the run.", [({}, report["wallSeconds"])])
+  metric("srm_connector_run_cpu_seconds", "gauge", "CPU time of the run.", [({}, report["cpuSeconds"])])
+  if report["peakRSSBytes"] is not None:
+    metric("srm_connector_peak_rss_bytes", "gauge", "Peak resident memory of the run.", [({}, report["peakRSSBytes"])])
+  stages = report["stages"].items()
+  metric("srm_connector_stage_wall_seconds", "gauge", "Wall time spent per stage.", [({"stage": name}, s["wallSeconds"]) for name, s in stages])
+  metric("srm_connector_stage_cpu_seconds", "gauge", "CPU time spent per stage.", [({"stage": name}, s["cpuSeconds"]) for name, s in stages])
+  metric("srm_connector_stage_calls", "gauge", "Number of times each stage ran.", [({"stage": name}, s["count"]) for name, s in stages])
+  http = report["http"].items()
+  metric("srm_connector_http_errors", "gauge", "HTTP calls answered with an error status per endpoint.", [({"endpoint": e}, r["errors"]) for e, r in http])
+  metric("srm_connector_http_sent_bytes", "gauge", "Request bytes sent per endpoint.", [({"endpoint": e}, r["bytesSent"]) for e, r in http])
+  metric("srm_connector_http_received_bytes", "gauge", "Response bytes received per endpoint.", [({"endpoint": e}, r["bytesReceived"]) for e, r in http])
+  samples = []
+  for endpoint, request in http:
+    latency = request["latencySeconds"]
+    for quantile, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")):
+      samples.append(({"endpoint": endpoint, "quantile": quantile}, latency[key]))
+  metric("srm_connector_http_latency_seconds", "summary", "Latency of the HTTP calls per endpoint.", samples)
+  for endpoint, request in http:
+    lines.append(f'srm_connector_http_latency_seconds_sum{{endpoint="{label(endpoint)}"}} {request["latencySeconds"]["sum"]}')
+    lines.append(f'srm_connector_http_latency_seconds_count{{endpoint="{label(endpoint)}"}} {request["count"]}')
+  return "\n".join(lines) + "\n"
+
+def writeFile(path, text):
+  # write to a temporary file first, a textfile collector must never read a partial file
+  directory = os.path.dirname(os.path.abspath(path))
+  fd, tmpPath = tempfile.mkstemp(dir=directory)
+  with os.fdopen(fd, 'w', encoding='utf-8') as f:
+    f.write(text)
+  # mkstemp creates the file readable by its owner only, the collector usually runs as another user
+  os.chmod(tmpPath, 0o644)
+  os.replace(tmpPath, path)
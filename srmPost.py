@@ -2,25 +2,45 @@
 
 import os
 import pprint
-import requests
 import argparse
 import string
 import random
 from random import choice
-import nltk
-from nltk.corpus import wordnet
-from nltk.corpus import words
 import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import run_metrics
+import srm_client
+
+# Built-in word lists used to generate a project name when none is given, so the upload path does not need nltk.
+NAME_ADJECTIVES = ['amber', 'bold', 'brisk', 'calm', 'clever', 'crimson', 'eager', 'fuzzy', 'gentle', 'golden',
+                   'hidden', 'jolly', 'lively', 'lucky', 'mellow', 'misty', 'nimble', 'proud', 'quiet', 'rapid',
+                   'rustic', 'shiny', 'silent', 'silver', 'steady', 'sunny', 'swift', 'tidy', 'vivid', 'witty']
+NAME_NOUNS = ['badger', 'beacon', 'canyon', 'cedar', 'comet', 'falcon', 'forest', 'garden', 'glacier', 'harbor',
+              'heron', 'island', 'lantern', 'maple', 'meadow', 'otter', 'pebble', 'planet', 'prairie', 'raven',
+              'river', 'rocket', 'saddle', 'spruce', 'summit', 'thistle', 'tiger', 'valley', 'willow', 'zephyr']
 
 def generate_random_project_name():
-    english_words = words.words()
-    return '-'.join(choice(english_words) for _ in range(2))
+    # nltk takes several hundred milliseconds to import, so it is only loaded here, when a random name is needed
+    try:
+        from nltk.corpus import words
+        english_words = words.words()
+        return '-'.join(choice(english_words) for _ in range(2))
+    except (ImportError, LookupError):
+        return generate_builtin_project_name()
+
+def generate_builtin_project_name():
+    return f'{choice(NAME_ADJECTIVES)}-{choice(NAME_NOUNS)}-{random.randint(1000, 9999)}'
 
 def check_project_exists(project_name, existing_projects):
     return project_name in existing_projects
 
 def get_project_branches(project_id, api_url, headers):
-    response = requests.get(f"{api_url}srm/x/projects/{project_id}/branches", headers=headers)
+    response = srm_client.getClient(api_url, headers).get(f"srm/x/projects/{project_id}/branches")
     if response.status_code == 200:
         branches = response.json()
 
@@ -35,52 +55,326 @@ def get_project_branches(project_id, api_url, headers):
         return {}    
 
 def get_existing_projects(api_url, headers):
-    response = requests.get(f"{api_url}srm/api/projects", headers=headers)
+    response = srm_client.getClient(api_url, headers).get("srm/api/projects")
     if response.status_code == 200:
         projects = response.json()['projects']
         return {project['name']: project['id'] for project in projects}
     else:
         print('Failed to retrieve projects, with status code: '+str(response.status_code))
-        return {}
+        return None
     
+class ProjectLookupError(Exception):
+    # SRM failed to answer a project lookup, the project may exist so it must not be created
+    pass
+
+class ProjectIndex:
+    # Local project name -> id index per SRM url, shared by every lookup in this process. Projects are
+    # looked up by name with the projects query endpoint and added to the index one at a time, the full
+    # project list is only downloaded if the query endpoint is not available (at most once per refresh_interval).
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self.projects = {}
+        self.last_refresh = {}
+        self.query_supported = {}
+        self.lock = threading.Lock()
+
+    def add(self, api_url, project_name, project_id):
+        with self.lock:
+            self.projects.setdefault(api_url, {})[project_name.lower()] = project_id
+
+    def get(self, api_url, project_name):
+        with self.lock:
+            return self.projects.get(api_url, {}).get(project_name.lower())
+
+    def query(self, api_url, project_name, headers):
+        # returns the matching project id, None if there is no match, or False if SRM does not support the query.
+        # Other failures (still failing after the retries) only fail this lookup, the query is tried again by the next one
+        response = srm_client.getClient(api_url, headers).post("srm/api/projects/query", json={"filter": {"name": project_name}}, idempotent=True)
+        if response.status_code in (404, 405):
+            return False
+        if response.status_code != 200:
+            raise ProjectLookupError(f'Failed to look up project {project_name}, with status code: {response.status_code}')
+        projects = response.json()
+        if isinstance(projects, dict):
+            projects = projects.get("projects", [])
+        for project in projects:
+            self.add(api_url, project['name'], project['id'])
+        return self.get(api_url, project_name)
+
+    def refresh(self, api_url, headers):
+        with self.lock:
+            if time.time() - self.last_refresh.get(api_url, 0) < self.refresh_interval:
+                return
+        projects = get_existing_projects(api_url, headers)
+        if projects is None:
+            # the next lookup downloads the list again, a project missing from the index may still exist
+            raise ProjectLookupError(f'Failed to retrieve the project list from {api_url}')
+        for name, project_id in projects.items():
+            self.add(api_url, name, project_id)
+        with self.lock:
+            self.last_refresh[api_url] = time.time()
+
+    def find(self, api_url, project_name, headers):
+        project_id = self.get(api_url, project_name)
+        if project_id is not None:
+            return project_id
+        if self.query_supported.get(api_url, True):
+            project_id = self.query(api_url, project_name, headers)
+            if project_id is not False:
+                return project_id
+            print('Project query is not available, falling back to the full project list.')
+            self.query_supported[api_url] = False
+        self.refresh(api_url, headers)
+        return self.get(api_url, project_name)
+
+project_index = ProjectIndex()
+
+def find_project(api_url, project_name, headers):
+    # returns the id of the project with the given name (case insensitive), or None if it does not exist.
+    # Raises ProjectLookupError if SRM failed to answer
+    return project_index.find(api_url, project_name, headers)
+
 def create_project(api_url, project_name, headers):
-    response = requests.post(f"{api_url}srm/api/projects", json={'name': project_name}, headers=headers)
+    response = srm_client.getClient(api_url, headers).post("srm/api/projects", json={'name': project_name})
     if response.status_code == 201:
         print(f'{project_name} created successfully.')
+        project_index.add(api_url, project_name, response.json()['id'])
         return response.json()['id']
     else:
         print('Failed to create project. Status code: '+str(response.status_code))
         print('Failed to create project Name: '+ project_name)
         return None
     
-def create_detection_method(api_url, detection_method, headers):
-    methods = requests.get(f"{api_url}srm/api/detection-methods", headers=headers)
-    if methods.status_code == 200:
-        # Go through list of methods and see if the method already exists:
-        currentMethods = methods.json()
-        for meth in currentMethods:
-            if meth.get("name").lower() == detection_method.lower():
-                print(f"Found detection method: {detection_method}")
-                return meth.get("id") 
-        # if we get here we didn't find it, so we should create it
-        response = requests.post(f"{api_url}srm/api/detection-methods", json={'name': detection_method}, headers=headers)
+class DetectionMethodIndex:
+    # Local detection method name -> id index per SRM url. The full list of detection methods is downloaded
+    # once per url and kept for the rest of the run, methods created afterwards are added to it.
+    def __init__(self):
+        self.methods = {}
+        self.lock = threading.Lock()
+
+    def load(self, api_url, headers):
+        # returns a copy of the known methods, or None if the list could not be downloaded
+        with self.lock:
+            if api_url in self.methods:
+                return dict(self.methods[api_url])
+        response = srm_client.getClient(api_url, headers).get("srm/api/detection-methods")
+        if response.status_code != 200:
+            print('Failed to get detection methods. Status code: '+str(response.status_code))
+            return None
+        with self.lock:
+            methods = self.methods.setdefault(api_url, {})
+            for meth in response.json():
+                methods.setdefault(meth.get("name").lower(), meth.get("id"))
+            return dict(methods)
+
+    def add(self, api_url, detection_method, method_id):
+        with self.lock:
+            self.methods.setdefault(api_url, {})[detection_method.lower()] = method_id
+
+detection_method_index = DetectionMethodIndex()
+
+def reconcile_detection_methods(api_url, detection_methods, headers, max_workers=8):
+    # Makes sure every requested detection method exists in SRM, returns detection method -> id (None if it could
+    # not be created). The existing methods are compared case insensitively and only the missing ones are created, concurrently.
+    existing = detection_method_index.load(api_url, headers)
+    if existing is None:
+        for detection_method in detection_methods:
+            print('Failed to create detection method: '+ detection_method)
+        return {detection_method: None for detection_method in detection_methods}
+
+    missing = {}
+    for detection_method in detection_methods:
+        if detection_method.lower() in existing:
+            print(f"Found detection method: {detection_method}")
+        else:
+            missing.setdefault(detection_method.lower(), detection_method)
+
+    def create(detection_method):
+        response = srm_client.getClient(api_url, headers).post("srm/api/detection-methods", json={'name': detection_method})
         if response.status_code == 200:
             print(f'Detection method: {detection_method} created successfully.')
+            detection_method_index.add(api_url, detection_method, response.json()['id'])
             return response.json()['id']
         else:
             print('Failed to create detection method. Status code: '+str(response.status_code))
             print('Failed to create detection method: '+ detection_method)
-            return None        
-    else:
-        print('Failed to get detection methods. Status code: '+str(methods.status_code))
-        print('Failed to create detection method: '+ detection_method)
-        return None    
+            return None
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for name, method_id in zip(missing, executor.map(create, missing.values())):
+                existing[name] = method_id
+    return {detection_method: existing.get(detection_method.lower()) for detection_method in detection_methods}
+
+def create_detection_method(api_url, detection_method, headers):
+    return reconcile_detection_methods(api_url, [detection_method], headers).get(detection_method)
     
-def start_analysis(api_url, headers, project_id, branch_name, file_path):
+class MultipartFile:
+    # multipart/form-data body for a single file that is read from disk in chunks while requests sends it,
+    # instead of building the whole body in memory. The length is known up front so no chunked encoding is needed.
+    def __init__(self, file_path, field_name='file', content_type='application/octet-stream', chunk_size=1024 * 1024):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        head = (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field_name}"; filename="{os.path.basename(file_path)}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.length = len(head) + os.path.getsize(file_path) + len(tail)
+        self.pending = [head]
+        self.file = open(file_path, 'rb')
+        self.tail = tail
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        if not self.pending and self.file is not None:
+            chunk = self.file.read(size)
+            if chunk:
+                return chunk
+            self.close()
+            self.pending = [self.tail]
+        if not self.pending:
+            return b''
+        chunk = self.pending.pop(0)
+        if len(chunk) > size:
+            self.pending.insert(0, chunk[size:])
+            chunk = chunk[:size]
+        return chunk
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def zip_file(file_path):
+    # compress the results into a zip archive next to the original file, SRM accepts zipped results
+    fd, zip_path = tempfile.mkstemp(suffix='.zip', dir=os.path.dirname(os.path.abspath(file_path)))
+    os.close(fd)
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(file_path, arcname=os.path.basename(file_path))
+    print(f'Compressed {os.path.getsize(file_path)} bytes to {os.path.getsize(zip_path)} bytes for upload.')
+    return zip_path
+
+def post_file(api_url, path, file_path, headers, compress=False):
+    # stream the file (or a zip archive of it) to SRM as a multipart upload
+    with run_metrics.stage("upload"):
+        upload_path = zip_file(file_path) if compress else file_path
+        try:
+            content_type = 'application/zip' if compress else 'application/octet-stream'
+            return srm_client.getClient(api_url, headers).upload(path, lambda: MultipartFile(upload_path, content_type=content_type))
+        finally:
+            if compress:
+                os.remove(upload_path)
+
+class JobTracker:
+    # Watches the analysis jobs started in SRM without blocking the uploads: jobs are added as the uploads return
+    # their jobId, and wait() then polls the status of every outstanding job together, at a poll interval that
+    # grows by backoff after every round (up to max_poll_interval), until all jobs finished or the deadline passed.
+    # e.g. a batch import adds the job of every project it uploaded and only waits for them once all uploads are done.
+    # A job whose status can't be read (a 4xx answer, or max_failed_polls failed polls in a row) ends with status
+    # 'error', so wait() returns even without a timeout.
+    FINISHED = ('completed', 'failed', 'cancelled', 'canceled', 'error', 'not found')
+    # answers worth polling again, anything else in the 4xx range won't change by asking again (e.g. 401/403)
+    RETRYABLE = (408, 429)
+
+    def __init__(self, api_url, headers, poll_interval=2, max_poll_interval=30, backoff=1.5, max_workers=8, max_failed_polls=5):
+        self.client = srm_client.getClient(api_url, headers)
+        self.max_failed_polls = max_failed_polls
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def add(self, job_id, label=None, analysis_id=None):
+        with self.lock:
+            self.jobs[job_id] = {'label': label or job_id, 'analysisId': analysis_id, 'status': 'queued',
+                                 'started': time.time(), 'seconds': None, 'failedPolls': 0}
+
+    def add_response(self, response, label=None):
+        # register the job of an upload/analyze response, if SRM returned one
+        try:
+            analysis = response.json()
+        except ValueError:
+            return None
+        job_id = analysis.get('jobId') if isinstance(analysis, dict) else None
+        if job_id is not None:
+            self.add(job_id, label, analysis.get('analysisId'))
+        return job_id
+
+    def outstanding(self):
+        with self.lock:
+            return [job_id for job_id, job in self.jobs.items() if job['seconds'] is None]
+
+    def poll(self, job_id):
+        response = self.client.get(f"srm/api/jobs/{job_id}")
+        if response.status_code == 200:
+            status = str(response.json().get('status', '')).lower()
+        elif response.status_code == 404:
+            status = 'not found'
+        else:
+            print(f'Failed to get the status of job {job_id}, with status code: {response.status_code}')
+            with self.lock:
+                job = self.jobs[job_id]
+                job['failedPolls'] += 1
+                # keep polling while the next round may get an answer
+                if response.status_code // 100 != 4 or response.status_code in self.RETRYABLE:
+                    if job['failedPolls'] < self.max_failed_polls:
+                        return
+            status = 'error'
+        with self.lock:
+            job = self.jobs[job_id]
+            job['status'] = status
+            if response.status_code == 200:
+                job['failedPolls'] = 0
+            if status in self.FINISHED:
+                job['seconds'] = time.time() - job['started']
+                print(f"Analysis job {job_id} of {job['label']} {status} after {job['seconds']:.1f}s")
+
+    def wait(self, timeout=None):
+        # returns job id -> {'label', 'analysisId', 'status', 'seconds'}, jobs still running at the deadline get status 'timeout'
+        deadline = time.time() + timeout if timeout is not None else None
+        interval = self.poll_interval
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                outstanding = self.outstanding()
+                if outstanding:
+                    list(executor.map(self.poll, outstanding))
+                    outstanding = self.outstanding()
+                if not outstanding:
+                    break
+                remaining = deadline - time.time() if deadline is not None else interval
+                if remaining <= 0:
+                    with self.lock:
+                        for job_id in outstanding:
+                            self.jobs[job_id]['status'] = 'timeout'
+                    print(f'Stopped waiting for {len(outstanding)} analysis jobs after {timeout}s.')
+                    break
+                time.sleep(min(interval, remaining))
+                interval = min(self.max_poll_interval, interval * self.backoff)
+        with self.lock:
+            return {job_id: {key: value for key, value in job.items() if key not in ('started', 'failedPolls')} for job_id, job in self.jobs.items()}
+
+def start_analysis(api_url, headers, project_id, branch_name, file_path, compress=False, tracker=None, label=None):
     jsonBody= {
             "projectId": project_id
     }
-    response = requests.post(f"{api_url}srm/api/analysis-prep",json=jsonBody, headers=headers)
+    response = srm_client.getClient(api_url, headers).post("srm/api/analysis-prep", json=jsonBody)
     if response.status_code == 200:
         resp = response.json()
         prep_id = resp["prepId"]
@@ -107,7 +401,7 @@ def start_analysis(api_url, headers, project_id, branch_name, file_path):
             print(f'Branch {branch_name} does not exist, creating new branch {branch_name} from the project default branch: {default_branch}.')
             jsonBody = {"branch":{"parent": default_branch, "name": branch_name }}
 
-        branch_request = requests.put(f"{api_url}srm/x/analysis-prep/{prep_id}/branch",json=jsonBody, headers=headers)
+        branch_request = srm_client.getClient(api_url, headers).put(f"srm/x/analysis-prep/{prep_id}/branch", json=jsonBody)
     
     if branch_request.status_code != 200:
         print('ERROR: Failed to set project branch for analysis, with status code: '+str(branch_request.status_code)+" error message: "+ branch_request.text)
@@ -118,10 +412,7 @@ def start_analysis(api_url, headers, project_id, branch_name, file_path):
 
     # upload file for analysis
     print(f"Uploading file...")
-    with open(file_path, 'r') as file:
-        content = file.read()
-        # add appropriate headers to request:
-        upload_response = requests.post(f'{api_url}srm/api/analysis-prep/{prep_id}/upload', files={'file': content}, headers=headers)
+    upload_response = post_file(api_url, f'srm/api/analysis-prep/{prep_id}/upload', file_path, headers, compress)
 
     if upload_response.status_code == 202:
         print('File uploaded successfully.')
@@ -130,52 +421,72 @@ def start_analysis(api_url, headers, project_id, branch_name, file_path):
         return None
 
     # Run analysis:
-    run_analysis = requests.post(f"{api_url}srm/api/analysis-prep/{prep_id}/analyze", headers=headers)
+    run_analysis = srm_client.getClient(api_url, headers).post(f"srm/api/analysis-prep/{prep_id}/analyze")
     if run_analysis.status_code == 202:
         analysis_response = run_analysis.json()
         jobId = analysis_response["jobId"]
         analysis_id = analysis_response["analysisId"]
         print(f"Successfully started analysis on project id {project_id}, jobId: {jobId} analysisId: {analysis_id}")
+        if tracker is not None:
+            tracker.add(jobId, label, analysis_id)
         return analysis_response
     else:
         print(f"ERROR: Failed to start analysis on project id: {project_id}"+str(run_analysis.status_code)+" error message: "+ run_analysis.text)
 
-def upload_file(file_path, api_url, project_id, headers):
-    with open(file_path, 'rb') as file:
-        response = requests.post(f"{api_url}srm/api/projects/{project_id}/analysis", files={'file': file}, headers=headers)
+def upload_file(file_path, api_url, project_id, headers, compress=False, tracker=None, label=None):
+    response = post_file(api_url, f"srm/api/projects/{project_id}/analysis", file_path, headers, compress)
     if response.status_code == 202:
         print('File uploaded successfully.')
+        if tracker is not None:
+            tracker.add_response(response, label)
+        return True
     else:
         print(f'ERROR: Failed to upload file with response code {str(response.status_code)} error message: {response.text}')
+        return False
 
-def main(apiKey, api_url, project_name, file_path, branch_name=None):
+def main(apiKey, api_url, project_name, file_path, branch_name=None, compress=False, tracker=None):
     headers = {'Authorization': 'Bearer ' + apiKey}
-    # add trailing slash to srm url if needed:
-    if not api_url.endswith("/"):
-        api_url += "/"
+    api_url = srm_client.normalizeURL(api_url)
     
-    existing_projects = {k.lower(): v for k, v in get_existing_projects(api_url, headers).items()}
     if project_name is None:
         project_name = generate_random_project_name()
         project_id = create_project(api_url, project_name, headers)
-    elif project_name.lower() not in existing_projects:
-        project_id = create_project(api_url, project_name, headers)
     else:
-        project_id = existing_projects[project_name.lower()]
+        try:
+            project_id = find_project(api_url, project_name, headers)
+        except ProjectLookupError as e:
+            print(f'ERROR: {e}')
+            return False
+        if project_id is None:
+            project_id = create_project(api_url, project_name, headers)
 
+    # returns a truthy value when SRM accepted the results
     if project_id is not None and (branch_name is None or branch_name == ""):
-        upload_file(file_path, api_url, project_id, headers)
+        return upload_file(file_path, api_url, project_id, headers, compress, tracker, project_name)
     else:
-        start_analysis(api_url, headers, project_id, branch_name, file_path)
+        return start_analysis(api_url, headers, project_id, branch_name, file_path, compress, tracker, project_name)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('file_path', help='Path to the .xml file')
     parser.add_argument('project_name', nargs='?', default=os.environ.get('SRM_PROJECT_NAME'), help='SRM project name')
-    parser.add_argument('branch_name', default=None, required=False ,help='Optional, project branch name')
+    parser.add_argument('branch_name', nargs='?', default=None, help='Optional, project branch name')
     parser.add_argument('--url', default=os.environ.get('SRM_URL'), help='URL for SRM')
     parser.add_argument('--api_key', default=os.environ.get('SRM_API_KEY'), help='API key for authentication')
+    parser.add_argument('--zip', action='store_true', default=os.environ.get('SRM_UPLOAD_ZIP', '').lower() in ('1', 'true', 'yes'), help='Optional, compress the results into a zip archive before uploading them')
+    parser.add_argument('--wait', action='store_true', help='Optional, wait for SRM to finish the analysis of the uploaded results')
+    parser.add_argument('--timeout', type=float, default=None, help='Optional, with --wait the maximum number of seconds to wait for the analysis')
     args = parser.parse_args()
 
-    main(args.api_key, args.url, args.project_name, args.file_path)
+    tracker = JobTracker(args.url, {'Authorization': 'Bearer ' + args.api_key}) if args.wait else None
+    try:
+        if not main(args.api_key, args.url, args.project_name, args.file_path, args.branch_name, compress=args.zip, tracker=tracker):
+            sys.exit(2)
+        if tracker is not None:
+            jobs = tracker.wait(args.timeout)
+            if any(job['status'] != 'completed' for job in jobs.values()):
+                sys.exit(2)
+    finally:
+        # close the pooled SRM connections
+        srm_client.closeClients()
     
\ No newline at end of file
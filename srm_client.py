@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import threading
+from requests.adapters import HTTPAdapter
+import http_client
+import run_metrics
+
+# Client for the SRM API owning one keep-alive session, so every call to the same SRM server reuses the pooled
+# connections instead of opening (and TLS handshaking) a new one per request. The SRM url is normalized once and
+# the auth header is set on the session, callers only pass the path of the endpoint, e.g.:
+#   client = getClient("https://srm.example.com", {'Authorization': 'Bearer ' + apiKey})
+#   response = client.get("srm/api/projects")
+# The clients are shared per (url, auth) by getClient, so all the srmPost and configureToolService functions
+# called with the same url and headers go through the same session.
+class SRMClient:
+
+  def __init__(self, url, headers, maxConnections=10):
+    self.url = normalizeURL(url)
+    self.session = run_metrics.instrument(http_client.RetryingSession())
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=maxConnections)
+    self.session.mount('https://', adapter)
+    self.session.mount('http://', adapter)
+    self.session.headers.update(headers)
+
+  def endpoint(self, path):
+    return self.url + path.lstrip('/')
+
+  def get(self, path, **kwargs):
+    return self.session.get(self.endpoint(path), **kwargs)
+
+  def post(self, path, **kwargs):
+    return self.session.post(self.endpoint(path), **kwargs)
+
+  def put(self, path, **kwargs):
+    return self.session.put(self.endpoint(path), **kwargs)
+
+  def upload(self, path, createBody):
+    # createBody returns a fresh streamed body for every attempt, a retried upload can't reuse the (partly) sent one
+    url = self.endpoint(path)
+    def send():
+      body = createBody()
+      try:
+        return self.session.requestOnce('POST', url, data=body, headers={'Content-Type': body.content_type})
+      finally:
+        body.close()
+    return http_client.sendWithRetry(send, 'POST', url, self.session.retries, self.session.backoff, self.session.maxBackoff)
+
+  def close(self):
+    self.session.close()
+
+def normalizeURL(url):
+  # add trailing slash to srm url if needed
+  return url if url.endswith("/") else url + "/"
+
+clients = {}
+clientsLock = threading.Lock()
+
+def getClient(url, headers):
+  key = (normalizeURL(url), headers.get('Authorization'))
+  with clientsLock:
+    client = clients.get(key)
+    if client is None:
+      client = clients[key] = SRMClient(url, headers)
+    return client
+
+def closeClients():
+  with clientsLock:
+    for client in clients.values():
+      client.close()
+    clients.clear()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+# Characters that are not allowed anywhere in an XML 1.0 document, even escaped.
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def sanitize(value):
+  if value is None:
+    return None
+  return INVALID_XML_CHARS.sub('', str(value))
+
+# Writes an SRM XML report incrementally, each finding is written to the output file as soon as it is
+# added so only one finding has to be held in memory at a time, e.g.:
+#   with SRMXMLWriter("srm-output.xml", date="2024-01-01", tool="My Tool") as writer:
+#     for issue in issues:
+#       writer.writeFinding(findingElement)
+class SRMXMLWriter:
+
+  def __init__(self, outputFile, date, tool, indent=True):
+    self.outputFile = outputFile
+    self.date = date
+    self.tool = tool
+    self.indent = indent
+    self.findingCount = 0
+    self.file = None
+
+  def __enter__(self):
+    self.open()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+    else:
+      self.abort()
+
+  def open(self):
+    self.file = open(self.outputFile, 'w', encoding='utf-8')
+    self.file.write('<?xml version="1.0" ?>\n')
+    self.file.write(f'<report date={quoteattr(sanitize(self.date or ""))} tool={quoteattr(sanitize(self.tool or ""))}>')
+    self.file.write('\n\t<findings>' if self.indent else '<findings>')
+
+  def writeFinding(self, finding):
+    self.file.write(self.serializeFinding(finding))
+    self.findingCount += 1
+
+  def writeFragment(self, fragment):
+    # Write a finding that was already serialized with serializeFinding (using the same indent setting)
+    self.file.write(fragment)
+    self.findingCount += 1
+
+  def serializeFinding(self, finding):
+    # ElementTree escapes markup characters, but not characters that are illegal in XML, strip those first
+    for element in finding.iter():
+      element.text = sanitize(element.text)
+      for key, value in element.attrib.items():
+        element.attrib[key] = sanitize(value)
+    if self.indent:
+      ET.indent(finding, space='\t', level=2)
+      return '\n\t\t' + ET.tostring(finding, encoding='unicode')
+    return ET.tostring(finding, encoding='unicode')
+
+  def close(self):
+    if self.file is None:
+      return
+    self.file.write('\n\t</findings>\n</report>\n' if self.indent else '</findings></report>\n')
+    self.file.close()
+    self.file = None
+
+  def abort(self):
+    # The conversion failed, the partial report is removed instead of being closed into a well formed report that a
+    # later upload (or SRM tool orchestration) would import as complete
+    if self.file is None:
+      return
+    self.file.close()
+    self.file = None
+    os.remove(self.outputFile)
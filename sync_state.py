@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import tempfile
+
+# Bump when the generated finding XML changes, so fragments written by an older converter are not reused.
+FRAGMENT_VERSION = "3"
+
+# Remembers what was imported by the last successful run so the next run only does the work for issues that changed.
+# The state directory contains:
+#   state.json - the issue id -> fingerprint map of the last successful import
+#   fragments/ - the serialized SRM XML finding for each fingerprint, reused as is for unchanged issues
+# A new state is only saved by commit(), which should be called once the results have been handed to SRM.
+class SyncState:
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.statePath = os.path.join(directory, "state.json")
+    self.fragmentsDir = os.path.join(directory, "fragments")
+    os.makedirs(self.fragmentsDir, exist_ok=True)
+    self.previous = {}
+    try:
+      with open(self.statePath, 'r', encoding='utf-8') as f:
+        self.previous = json.load(f).get("fingerprints", {})
+    except (OSError, ValueError):
+      print(f"No previous import state found in {directory}, all issues will be converted.")
+    self.current = {}
+    self.reused = 0
+
+  @staticmethod
+  def fingerprint(issue, variant=""):
+    # variant holds the converter settings that change the finding XML, e.g. the body size cap
+    content = json.dumps(issue, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256((FRAGMENT_VERSION + variant + content).encode("utf-8")).hexdigest()
+
+  def isUnchanged(self):
+    # Once all the issues went through getFragment, returns True if nothing changed since the last import
+    return len(self.previous) > 0 and self.current == self.previous
+
+  def fragmentPath(self, fingerprint, indent):
+    return os.path.join(self.fragmentsDir, fingerprint + (".xml" if indent else ".compact.xml"))
+
+  def getFragment(self, issueId, fingerprint, indent):
+    self.current[str(issueId)] = fingerprint
+    if self.previous.get(str(issueId)) != fingerprint:
+      return None
+    try:
+      with open(self.fragmentPath(fingerprint, indent), 'r', encoding='utf-8', newline='') as f:
+        fragment = f.read()
+    except OSError:
+      return None
+    self.reused += 1
+    return fragment
+
+  def forget(self, issueId):
+    # the issue is not remembered as imported, the next run converts it again
+    self.current.pop(str(issueId), None)
+
+  def saveFragment(self, fingerprint, indent, fragment):
+    with open(self.fragmentPath(fingerprint, indent), 'w', encoding='utf-8', newline='') as f:
+      f.write(fragment)
+
+  def commit(self):
+    fd, tmpPath = tempfile.mkstemp(dir=self.directory)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      json.dump({"fingerprints": self.current}, f)
+    os.replace(tmpPath, self.statePath)
+    # remove the fragments of issues that are gone or changed
+    currentFingerprints = set(self.current.values())
+    for entry in os.scandir(self.fragmentsDir):
+      if entry.name.split(".")[0] not in currentFingerprints:
+        os.remove(entry.path)
+    self.previous = self.current
+    print(f"Saved import state for {len(self.current)} issues, {self.reused} unchanged issues were reused.")